@@ -0,0 +1,56 @@
+"""Datasets shaped like the ones of a real provider, shared by the benchmarks."""
+
+from datetime import timedelta
+from pathlib import Path
+
+from ingestify.domain import Dataset, File, Identifier, Revision
+from ingestify.domain.models.dataset.dataset import DatasetState
+from ingestify.utils import utcnow
+
+
+def build_dataset(idx: int, revision_count: int, file_count: int) -> Dataset:
+    """A dataset with `revision_count` revisions that all modify `file_count` files."""
+    now = utcnow()
+    identifier = Identifier(competition_id=11, season_id=90, match_id=idx)
+    revisions = [
+        Revision(
+            revision_id=revision_id,
+            created_at=now + timedelta(minutes=revision_id),
+            description="Update",
+            modified_files=[
+                File(
+                    file_id=f"file{file_idx}",
+                    created_at=now,
+                    modified_at=now + timedelta(minutes=revision_id),
+                    tag="8f14e45fceea167a5a36dedd4bea2543c2b3f0c1",
+                    size=1_000_000,
+                    content_type="application/json",
+                    data_feed_key=f"file{file_idx}",
+                    data_spec_version="v1",
+                    data_serialization_format="json",
+                    storage_size=100_000,
+                    storage_compression_method="gzip",
+                    storage_path=Path(
+                        f"main/provider=statsbomb/dataset_type=match/{identifier}/"
+                        f"{revision_id}/file{file_idx}.json.gz"
+                    ),
+                    revision_id=revision_id,
+                )
+                for file_idx in range(file_count)
+            ],
+        )
+        for revision_id in range(revision_count)
+    ]
+    return Dataset(
+        bucket="main",
+        dataset_id=f"dataset-{idx}",
+        name=f"Match {idx}",
+        state=DatasetState.COMPLETE,
+        dataset_type="match",
+        provider="statsbomb",
+        identifier=identifier,
+        metadata={"match_id": idx},
+        created_at=now,
+        updated_at=now,
+        revisions=revisions,
+    )
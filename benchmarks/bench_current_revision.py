@@ -0,0 +1,100 @@
+"""
+Measure the planning loop over datasets with many revisions: decide whether to
+refetch a dataset, and look up the current version of each of its files (like
+`DatasetStore._persist_files` and `load_files` do). Before, the squashed revision and
+the file maps were built again on every access. Now they are cached (after).
+
+The "before" case is an approximation: it re-implements the old squashing and file
+maps in this script, as the old code path doesn't exist anymore.
+
+    python benchmarks/bench_current_revision.py [dataset_count] [revision_count] [file_count]
+"""
+
+import sys
+import time
+from datetime import timedelta
+
+from _datasets import build_dataset
+from ingestify.domain import Dataset, Revision
+from ingestify.utils import utcnow
+
+
+def modified_files_map(revision: Revision):
+    return {file.file_id: file for file in revision.modified_files}
+
+
+def squash(dataset: Dataset) -> Revision:
+    files = {}
+    for revision in dataset.revisions:
+        for file_id, file in modified_files_map(revision).items():
+            files[file_id] = file
+    return Revision(
+        revision_id=dataset.revisions[-1].revision_id,
+        created_at=dataset.revisions[-1].created_at,
+        description="Squashed revision",
+        is_squashed=True,
+        modified_files=list(files.values()),
+    )
+
+
+def plan_before(dataset: Dataset, files_last_modified: dict):
+    # FetchPolicy.should_refetch
+    current_revision = squash(dataset)
+    modified_files = modified_files_map(current_revision)
+    changed = any(
+        file_id not in modified_files
+        or modified_files[file_id].modified_at < last_modified
+        for file_id, last_modified in files_last_modified.items()
+    )
+
+    # DatasetStore._persist_files, the map was built for every file
+    current_revision = squash(dataset)
+    for file_id in files_last_modified:
+        modified_files_map(current_revision).get(file_id)
+
+    # DatasetStore.load_files
+    current_revision = squash(dataset)
+    for file in current_revision.modified_files:
+        file.revision_id
+    return changed
+
+
+def plan_after(dataset: Dataset, files_last_modified: dict):
+    changed = dataset.current_revision.is_changed(files_last_modified)
+
+    current_revision = dataset.current_revision
+    for file_id in files_last_modified:
+        current_revision.modified_files_map.get(file_id)
+
+    for file in current_revision.modified_files:
+        current_revision.get_file_revision_id(file.file_id)
+    return changed
+
+
+def measure(name, plan, datasets, files_last_modified):
+    start = time.perf_counter()
+    for dataset in datasets:
+        plan(dataset, files_last_modified)
+    duration = time.perf_counter() - start
+    print(f"{name:>7}: {duration:8.3f} s")
+
+
+def main(dataset_count=1000, revision_count=50, file_count=20):
+    datasets = [
+        build_dataset(idx, revision_count, file_count) for idx in range(dataset_count)
+    ]
+    files_last_modified = {
+        f"file{file_idx}": utcnow() - timedelta(days=1)
+        for file_idx in range(file_count)
+    }
+
+    print(
+        f"Planning {dataset_count} datasets with {revision_count} revisions of "
+        f"{file_count} files"
+    )
+    measure("before", plan_before, datasets, files_last_modified)
+    measure("after", plan_after, datasets, files_last_modified)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,142 @@
+"""
+Compare the storage codecs on StatsBomb-shaped event data: compression ratio, and
+compression and decompression throughput (of the uncompressed size).
+
+    python benchmarks/bench_storage_codecs.py [match_count] [events_per_match]
+
+Codecs for which the package is not installed are skipped.
+"""
+
+import json
+import random
+import shutil
+import sys
+import time
+import uuid
+from io import BytesIO
+
+from ingestify.application.codecs import get_codec
+from ingestify.exceptions import ConfigurationError
+
+CODECS = [
+    ("none", {}),
+    ("gzip", {"level": 1}),
+    ("gzip", {"level": 6}),
+    ("gzip", {"level": 9}),
+    ("zstd", {"level": 1}),
+    ("zstd", {"level": 3}),
+    ("zstd", {"level": 9}),
+    ("lz4", {"level": 0}),
+    ("lz4", {"level": 9}),
+]
+
+EVENT_TYPES = [
+    "Pass",
+    "Ball Receipt*",
+    "Carry",
+    "Pressure",
+    "Shot",
+    "Duel",
+    "Clearance",
+]
+
+
+def build_events(event_count: int, seed: int) -> bytes:
+    rnd = random.Random(seed)
+    players = [
+        {"id": 5000 + idx, "name": f"Player {idx}"}
+        for idx in range(rnd.randint(22, 30))
+    ]
+    teams = [{"id": 200, "name": "Home FC"}, {"id": 201, "name": "Away United"}]
+
+    events = []
+    for idx in range(event_count):
+        minute, second = divmod(idx * 5400 // event_count, 60)
+        event_type = rnd.choice(EVENT_TYPES)
+        event = {
+            "id": str(uuid.UUID(int=rnd.getrandbits(128))),
+            "index": idx + 1,
+            "period": 1 if minute < 45 else 2,
+            "timestamp": f"00:{minute % 45:02d}:{second:02d}.{rnd.randint(0, 999):03d}",
+            "minute": minute,
+            "second": second,
+            "type": {"id": EVENT_TYPES.index(event_type) + 30, "name": event_type},
+            "possession": idx // 8,
+            "possession_team": rnd.choice(teams),
+            "play_pattern": {"id": 1, "name": "Regular Play"},
+            "team": rnd.choice(teams),
+            "player": rnd.choice(players),
+            "position": {"id": rnd.randint(1, 25), "name": "Center Forward"},
+            "location": [round(rnd.uniform(0, 120), 1), round(rnd.uniform(0, 80), 1)],
+            "duration": round(rnd.uniform(0, 3), 6),
+            "related_events": [
+                str(uuid.UUID(int=rnd.getrandbits(128)))
+                for _ in range(rnd.randint(0, 2))
+            ],
+        }
+        if event_type == "Pass":
+            event["pass"] = {
+                "recipient": rnd.choice(players),
+                "length": round(rnd.uniform(1, 60), 6),
+                "angle": round(rnd.uniform(-3.14, 3.14), 6),
+                "height": {"id": 1, "name": "Ground Pass"},
+                "end_location": [
+                    round(rnd.uniform(0, 120), 1),
+                    round(rnd.uniform(0, 80), 1),
+                ],
+                "body_part": {"id": 40, "name": "Right Foot"},
+            }
+        events.append(event)
+    return json.dumps(events).encode("utf-8")
+
+
+def measure(codec, files):
+    raw_size = sum(len(content) for content in files)
+    compressed = []
+
+    start = time.perf_counter()
+    for content in files:
+        stream = BytesIO()
+        with codec.writer(stream) as fp:
+            fp.write(content)
+        compressed.append(stream.getvalue())
+    compress_duration = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for content in compressed:
+        output = BytesIO()
+        with codec.reader(BytesIO(content)) as fp:
+            shutil.copyfileobj(fp, output)
+    decompress_duration = time.perf_counter() - start
+
+    compressed_size = sum(len(content) for content in compressed)
+    return (
+        raw_size / compressed_size,
+        raw_size / compress_duration / 1024 / 1024,
+        raw_size / decompress_duration / 1024 / 1024,
+    )
+
+
+def main(match_count=10, events_per_match=3500):
+    files = [build_events(events_per_match, seed) for seed in range(match_count)]
+    raw_size = sum(len(content) for content in files)
+    print(f"{match_count} event files, {raw_size / 1024 / 1024:.1f} MB in total")
+    print(f"{'codec':>10} {'ratio':>7} {'compress':>14} {'decompress':>14}")
+
+    for method, options in CODECS:
+        name = f"{method}" + (f"-{options['level']}" if "level" in options else "")
+        try:
+            codec = get_codec(method, **options)
+        except ConfigurationError:
+            print(f"{name:>10} skipped: not installed")
+            continue
+
+        ratio, compress_speed, decompress_speed = measure(codec, files)
+        print(
+            f"{name:>10} {ratio:7.2f} {compress_speed:9.1f} MB/s "
+            f"{decompress_speed:9.1f} MB/s"
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
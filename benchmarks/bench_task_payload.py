@@ -0,0 +1,87 @@
+"""
+Compare the pickled size of UpdateDatasetTasks, and the time it takes to pickle them,
+when the full Dataset is shipped (before) versus only a reference to it (after).
+
+    python benchmarks/bench_task_payload.py [dataset_count] [revision_count] [file_count]
+"""
+
+import sys
+import tempfile
+import time
+
+import cloudpickle
+
+from _datasets import build_dataset
+from ingestify.application.loader import UpdateDatasetTask
+from ingestify.domain import DataSpecVersionCollection
+from ingestify.main import get_dataset_store_by_urls
+
+
+class LegacyUpdateDatasetTask:
+    """The UpdateDatasetTask as it was: it holds the Source, Dataset and DatasetStore."""
+
+    def __init__(self, source, dataset, dataset_identifier, data_spec_versions, store):
+        self.source = source
+        self.dataset = dataset
+        self.dataset_identifier = dataset_identifier
+        self.data_spec_versions = data_spec_versions
+        self.store = store
+
+
+def measure(name, tasks):
+    total_bytes = 0
+    duration = 0.0
+    for task in tasks:
+        start = time.perf_counter()
+        total_bytes += len(cloudpickle.dumps(task))
+        duration += time.perf_counter() - start
+    print(f"{name:>7}: {total_bytes / 1024 / 1024:10.1f} MB {duration:8.2f} s")
+
+
+def main(dataset_count=100_000, revision_count=10, file_count=3):
+    data_spec_versions = DataSpecVersionCollection.from_dict({"default": {"v1"}})
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = get_dataset_store_by_urls(
+            dataset_url=f"sqlite:///{tmp_dir}/catalog.db",
+            file_url=f"file://{tmp_dir}/files",
+            bucket="main",
+        )
+
+        def datasets():
+            for idx in range(dataset_count):
+                yield build_dataset(idx, revision_count, file_count)
+
+        print(
+            f"Pickling {dataset_count} tasks. Datasets with {revision_count} revisions "
+            f"of {file_count} files"
+        )
+        measure(
+            "before",
+            (
+                LegacyUpdateDatasetTask(
+                    source=None,
+                    dataset=dataset,
+                    dataset_identifier=dataset.identifier,
+                    data_spec_versions=data_spec_versions,
+                    store=store,
+                )
+                for dataset in datasets()
+            ),
+        )
+        measure(
+            "after",
+            (
+                UpdateDatasetTask(
+                    source_name="statsbomb",
+                    dataset=dataset,
+                    dataset_identifier=dataset.identifier,
+                    data_spec_versions=data_spec_versions,
+                )
+                for dataset in datasets()
+            ),
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
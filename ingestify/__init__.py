@@ -5,7 +5,7 @@ except NameError:
     __INGESTIFY_SETUP__ = False
 
 if not __INGESTIFY_SETUP__:
-    from .infra import retrieve_http
+    from .infra import retrieve_http, retrieve_http_async
     from .source_base import Source
 
 __version__ = "0.0.5"
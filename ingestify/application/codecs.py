@@ -0,0 +1,240 @@
+import abc
+import gzip
+import importlib
+import io
+from typing import BinaryIO, Callable, Dict, Optional, Union
+
+from ingestify.exceptions import ConfigurationError
+
+
+class Codec(abc.ABC):
+    """
+    Compress files before they are stored by the FileRepository. Closing the file
+    objects returned by `writer` and `reader` doesn't close `fh`.
+    """
+
+    method: str
+    suffix: str
+
+    @abc.abstractmethod
+    def writer(self, fh: BinaryIO) -> BinaryIO:
+        """Return a file object that writes compressed data to `fh`."""
+
+    @abc.abstractmethod
+    def reader(self, fh: BinaryIO) -> BinaryIO:
+        """Return a file object that reads decompressed data from `fh`."""
+
+
+class _NonClosingStream(io.RawIOBase):
+    """Pass reads and writes to `fh`, without closing `fh` when closed."""
+
+    def __init__(self, fh: BinaryIO):
+        self.fh = fh
+
+    def readable(self) -> bool:
+        return True
+
+    def writable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        data = self.fh.read(len(b))
+        b[: len(data)] = data
+        return len(data)
+
+    def write(self, b) -> int:
+        return self.fh.write(b)
+
+
+class NoneCodec(Codec):
+    method = "none"
+    suffix = ""
+
+    def __init__(self, **kwargs):
+        pass
+
+    def writer(self, fh: BinaryIO) -> BinaryIO:
+        return _NonClosingStream(fh)
+
+    def reader(self, fh: BinaryIO) -> BinaryIO:
+        return _NonClosingStream(fh)
+
+
+class GzipCodec(Codec):
+    method = "gzip"
+    suffix = ".gz"
+
+    def __init__(self, level: int = 9):
+        self.level = level
+
+    def writer(self, fh: BinaryIO) -> BinaryIO:
+        return gzip.GzipFile(fileobj=fh, compresslevel=self.level, mode="wb")
+
+    def reader(self, fh: BinaryIO) -> BinaryIO:
+        return gzip.GzipFile(fileobj=fh, mode="rb")
+
+
+class ZstdCodec(Codec):
+    method = "zstd"
+    suffix = ".zst"
+
+    def __init__(self, level: int = 3):
+        # Fail early when the package is not installed
+        _import("zstandard", "zstd")
+        self.level = level
+
+    def writer(self, fh: BinaryIO) -> BinaryIO:
+        zstandard = _import("zstandard", "zstd")
+        return zstandard.ZstdCompressor(level=self.level).stream_writer(
+            fh, closefd=False
+        )
+
+    def reader(self, fh: BinaryIO) -> BinaryIO:
+        zstandard = _import("zstandard", "zstd")
+        return zstandard.ZstdDecompressor().stream_reader(fh, closefd=False)
+
+
+class Lz4Codec(Codec):
+    method = "lz4"
+    suffix = ".lz4"
+
+    def __init__(self, level: int = 0):
+        _import("lz4.frame", "lz4")
+        self.level = level
+
+    def writer(self, fh: BinaryIO) -> BinaryIO:
+        lz4_frame = _import("lz4.frame", "lz4")
+        return lz4_frame.LZ4FrameFile(fh, mode="wb", compression_level=self.level)
+
+    def reader(self, fh: BinaryIO) -> BinaryIO:
+        lz4_frame = _import("lz4.frame", "lz4")
+        return lz4_frame.LZ4FrameFile(fh, mode="rb")
+
+
+def _import(module: str, method: str):
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise ConfigurationError(
+            f"Storage compression method '{method}' requires the '{module}' package. "
+            f"Install it using: pip install ingestify[{method}]"
+        )
+
+
+class DecompressingStream(io.RawIOBase):
+    """
+    Read-only file object that decompresses while reading from the stream returned by
+    `open_fn`. Seeking forward reads (and discards) data, seeking backward opens the
+    underlying stream again.
+    """
+
+    def __init__(self, open_fn: Callable[[], BinaryIO], codec: Codec):
+        self.open_fn = open_fn
+        self.codec = codec
+        self._fh: Optional[BinaryIO] = None
+        self._reader: Optional[BinaryIO] = None
+        self._position = 0
+
+    def _open(self):
+        self._close_underlying()
+        self._fh = self.open_fn()
+        self._reader = self.codec.reader(self._fh)
+        self._position = 0
+
+    def _close_underlying(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._fh.close()
+            self._reader = self._fh = None
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if self._reader is None:
+            self._open()
+        data = self._reader.read(len(b))
+        b[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            raise io.UnsupportedOperation("Cannot seek from the end")
+
+        if offset < self._position or self._reader is None:
+            self._open()
+        while self._position < offset:
+            data = self._reader.read(min(offset - self._position, 1024 * 1024))
+            if not data:
+                break
+            self._position += len(data)
+        return self._position
+
+    def close(self):
+        self._close_underlying()
+        super().close()
+
+
+codecs = {
+    codec_cls.method: codec_cls
+    for codec_cls in [NoneCodec, GzipCodec, ZstdCodec, Lz4Codec]
+}
+
+
+def get_codec(method: Optional[str], **options) -> Codec:
+    # Files stored without compression method are not compressed
+    method = method or "none"
+    if method not in codecs:
+        raise ConfigurationError(f"Unknown storage compression method '{method}'")
+    return codecs[method](**options)
+
+
+CodecSpec = Union[str, dict]
+
+
+class CodecSelector:
+    """
+    Select the Codec to store a file with, based on its data_serialization_format.
+
+    The spec can be a method name (`"zstd"`), a dict with options
+    (`{"method": "gzip", "level": 6}`), or a dict with a default and codecs per
+    data_serialization_format:
+
+        default: {method: gzip, level: 6}
+        formats:
+          json: zstd
+          parquet: none
+    """
+
+    def __init__(self, spec: Optional[CodecSpec] = None):
+        spec = spec or "gzip"
+        if isinstance(spec, dict) and ("default" in spec or "formats" in spec):
+            self.default = self._build(spec.get("default", "gzip"))
+            self.formats: Dict[str, Codec] = {
+                data_serialization_format: self._build(format_spec)
+                for data_serialization_format, format_spec in spec.get(
+                    "formats", {}
+                ).items()
+            }
+        else:
+            self.default = self._build(spec)
+            self.formats = {}
+
+    @staticmethod
+    def _build(spec: CodecSpec) -> Codec:
+        if isinstance(spec, str):
+            return get_codec(spec)
+        options = dict(spec)
+        return get_codec(options.pop("method"), **options)
+
+    def get_codec(self, data_serialization_format: str) -> Codec:
+        return self.formats.get(data_serialization_format, self.default)
@@ -1,13 +1,24 @@
-import gzip
 import hashlib
+import io
 import logging
 import mimetypes
 import os
 import shutil
+import threading
 from dataclasses import asdict
 from io import BytesIO, StringIO
 
-from typing import Dict, List, Optional, Union, Callable, BinaryIO
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Union,
+    Callable,
+    BinaryIO,
+    Iterable,
+    Iterator,
+    Tuple,
+)
 
 from ingestify.domain.models.dataset.events import RevisionAdded, MetadataUpdated
 from ingestify.domain.models.dataset.file_collection import FileCollection
@@ -25,8 +36,23 @@ from ingestify.domain.models import (
     Revision,
     DatasetCreated,
 )
-from ingestify.utils import utcnow, map_in_pool
+from ingestify.exceptions import ConfigurationError, IngestifyError
+from ingestify.utils import (
+    utcnow,
+    map_in_pool,
+    map_ordered,
+    map_unordered,
+    spooled_temporary_file,
+)
 
+from .codecs import (
+    Codec,
+    CodecSelector,
+    CodecSpec,
+    DecompressingStream,
+    NoneCodec,
+    get_codec,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -37,30 +63,233 @@ class DatasetStore:
         dataset_repository: DatasetRepository,
         file_repository: FileRepository,
         bucket: str,
+        storage_compression: Optional[CodecSpec] = None,
+        file_layout: str = "hierarchical",
+        write_batch_size: Optional[int] = None,
+        write_max_latency: Optional[float] = None,
+        single_writer_batch_size: Optional[int] = None,
     ):
+        if file_layout not in ("hierarchical", "content_addressed"):
+            raise ConfigurationError(f"Unknown file layout '{file_layout}'")
+
         self.dataset_repository = dataset_repository
         self.file_repository = file_repository
-        self.storage_compression_method = "gzip"
+        self.codec_selector = CodecSelector(storage_compression)
+        # 'hierarchical': files are stored per dataset and revision
+        # 'content_addressed': files are stored once per content hash
+        self.file_layout = file_layout
         self.bucket = bucket
         self.event_bus: Optional[EventBus] = None
 
-    # def __getstate__(self):
-    #     return {"file_repository": self.file_repository, "bucket": self.bucket}
+        # Saved datasets are written in batches of `write_batch_size`, or by a timer
+        # when the oldest pending dataset waits for `write_max_latency` seconds. The
+        # default batch size of 1 saves every dataset right away.
+        self.write_batch_size = write_batch_size or int(
+            os.environ.get("INGESTIFY_WRITE_BATCH_SIZE", "1")
+        )
+        self.write_max_latency = write_max_latency or float(
+            os.environ.get("INGESTIFY_WRITE_MAX_LATENCY", "5")
+        )
+        # The batch size for the datasets of other processes, see `write_outbox`. All
+        # writes of all workers go through this store, so they are batched by default.
+        self.single_writer_batch_size = single_writer_batch_size or int(
+            os.environ.get("INGESTIFY_SINGLE_WRITER_BATCH_SIZE", "100")
+        )
+        self._init_write_buffer()
+
+        # When set, saved datasets and events are collected here instead, to be
+        # written by another (single writer) process. See `take_outbox`.
+        self.outbox: Optional[List[Tuple[str, object]]] = None
+
+    def _init_write_buffer(self):
+        self._write_lock = threading.Lock()
+        # Pending datasets in the order they were saved, keyed by object. Workers can
+        # send different versions (objects) of the same dataset; all are saved.
+        self._pending_datasets: Dict[int, Dataset] = {}
+        self._pending_events = []
+        self._flush_timer: Optional[threading.Timer] = None
+
+    def __getstate__(self):
+        # Pending writes stay with the store that has to flush them
+        state = self.__dict__.copy()
+        for key in (
+            "_write_lock",
+            "_pending_datasets",
+            "_pending_events",
+            "_flush_timer",
+        ):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_write_buffer()
 
     def set_event_bus(self, event_bus: EventBus):
         self.event_bus = event_bus
 
     def dispatch(self, event):
+        if self.outbox is not None:
+            self.outbox.append(("event", event))
+            return
+
+        with self._write_lock:
+            if self._pending_datasets:
+                # Handlers must be able to see the changes. Dispatch after the flush.
+                self._pending_events.append(event)
+                return
+
         if self.event_bus:
             self.event_bus.dispatch(event)
 
+    def _save(self, dataset: Dataset, batch_size: Optional[int] = None):
+        if self.outbox is not None:
+            self.outbox.append(("dataset", dataset))
+            return
+
+        with self._write_lock:
+            self._pending_datasets[id(dataset)] = dataset
+
+            should_flush = len(self._pending_datasets) >= (
+                batch_size or self.write_batch_size
+            )
+            if not should_flush:
+                self._start_flush_timer()
+        if should_flush:
+            self.flush()
+
+    def _start_flush_timer(self):
+        if self._flush_timer is None:
+            # Also write the pending datasets when no other dataset is saved
+            self._flush_timer = threading.Timer(
+                self.write_max_latency, self._flush_by_timer
+            )
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _flush_by_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Failed to save the pending datasets")
+
+    def take_outbox(self) -> List[Tuple[str, object]]:
+        """Return the datasets and events collected since the last call."""
+        outbox, self.outbox = self.outbox, []
+        return outbox
+
+    def write_outbox(self, outbox: List[Tuple[str, object]]):
+        """
+        Save the datasets, and dispatch the events, collected by another store. A
+        failing item doesn't stop the rest of the outbox.
+        """
+        for kind, item in outbox:
+            try:
+                if kind == "dataset":
+                    self._save(item, batch_size=self.single_writer_batch_size)
+                else:
+                    self.dispatch(item)
+            except Exception:
+                logger.exception(f"Failed to write a {kind} of the outbox")
+
+    def flush(self):
+        """
+        Save the pending datasets in a single transaction, and dispatch the events
+        that were held back until then.
+
+        A dataset that can't be saved doesn't stop the others: it's logged and dropped,
+        together with its events. When the whole transaction fails, the datasets are
+        saved one by one.
+        """
+        with self._write_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+
+            failed = []
+            try:
+                while self._pending_datasets:
+                    # Versions of the same dataset can't be saved in one transaction
+                    batch = {}
+                    for dataset in self._pending_datasets.values():
+                        if dataset.dataset_id in batch:
+                            break
+                        batch[dataset.dataset_id] = dataset
+
+                    failed.extend(self._save_batch(list(batch.values())))
+                    for dataset in batch.values():
+                        del self._pending_datasets[id(dataset)]
+            finally:
+                if self._pending_datasets:
+                    self._start_flush_timer()
+
+            events = [
+                event
+                for event in self._pending_events
+                if not any(
+                    getattr(event, "dataset", None) is dataset for dataset in failed
+                )
+            ]
+            self._pending_events = []
+
+        if self.event_bus:
+            for event in events:
+                try:
+                    self.event_bus.dispatch(event)
+                except Exception:
+                    # Logged by the EventBus. The other events must still be dispatched.
+                    pass
+
+    def _save_batch(self, datasets: List[Dataset]) -> List[Dataset]:
+        """Save the datasets, and return the ones that could not be saved."""
+        # A dataset that failed can be expired by the rollback
+        dataset_ids = {id(dataset): dataset.dataset_id for dataset in datasets}
+        try:
+            failed = self.dataset_repository.save_many(
+                bucket=self.bucket, datasets=datasets
+            )
+        except Exception as e:
+            if len(datasets) == 1:
+                failed = [(datasets[0], e)]
+            else:
+                logger.warning(
+                    f"Failed to save {len(datasets)} datasets at once. Saving them "
+                    f"one by one.",
+                    exc_info=True,
+                )
+                failed = []
+                for dataset in datasets:
+                    try:
+                        failed.extend(
+                            self.dataset_repository.save_many(
+                                bucket=self.bucket, datasets=[dataset]
+                            )
+                        )
+                    except Exception as e:
+                        failed.append((dataset, e))
+
+        for dataset, exception in failed:
+            logger.error(
+                f"Failed to save dataset {dataset_ids[id(dataset)]}. It's dropped, "
+                f"with its events.",
+                exc_info=exception,
+            )
+        logger.debug(f"Saved {len(datasets) - len(failed)} datasets")
+        return [dataset for dataset, _ in failed]
+
     def get_dataset_collection(
         self,
         dataset_type: Optional[str] = None,
         provider: Optional[str] = None,
         dataset_id: Optional[str] = None,
+        metadata_only: bool = False,
+        select: str = "full",
         **selector,
     ) -> DatasetCollection:
+        """
+        Use `select="summary"` to only load the current files of the datasets, instead
+        of all revisions and their files. See `Dataset.is_summary`.
+        """
         if "selector" in selector:
             selector = selector["selector"]
         if isinstance(selector, dict):
@@ -80,6 +309,8 @@ class DatasetStore:
             dataset_id=dataset_id,
             provider=provider,
             selector=selector,
+            metadata_only=metadata_only,
+            select=select,
         )
         return dataset_collection
 
@@ -88,36 +319,41 @@ class DatasetStore:
     #     dataset = self.dataset_repository.
     #     self.dataset_repository.destroy_dataset(dataset_id)
 
-    def _prepare_write_stream(self, file_: DraftFile) -> tuple[BytesIO, int, str]:
-        if self.storage_compression_method == "gzip":
-            stream = BytesIO()
-            with gzip.GzipFile(fileobj=stream, compresslevel=9, mode="wb") as fp:
-                shutil.copyfileobj(file_.stream, fp)
-
-            stream.seek(0, os.SEEK_END)
-            storage_size = stream.tell()
-            stream.seek(0)
-            suffix = ".gz"
-        else:
-            stream = file_.stream
-            storage_size = file_.size
-            suffix = ""
-
-        return stream, storage_size, suffix
-
-    def _prepare_read_stream(self) -> tuple[Callable[[BinaryIO], BytesIO], str]:
-        if self.storage_compression_method == "gzip":
-
-            def reader(fh: BinaryIO) -> BytesIO:
-                stream = BytesIO()
-                with gzip.GzipFile(fileobj=fh, compresslevel=9, mode="rb") as fp:
-                    shutil.copyfileobj(fp, stream)
-                stream.seek(0)
-                return stream
-
-            return reader, ".gz"
-        else:
-            return lambda fh: fh, ""
+    def _prepare_write_stream(
+        self, file_: DraftFile, codec: Codec
+    ) -> tuple[BinaryIO, int, Optional[str]]:
+        """
+        Compress the file. For the content-addressed layout the content hash (of the
+        uncompressed content) is computed at the same time.
+        """
+        content_hash = (
+            hashlib.sha256() if self.file_layout == "content_addressed" else None
+        )
+        if isinstance(codec, NoneCodec) and not content_hash:
+            return file_.stream, file_.size, None
+
+        stream = spooled_temporary_file()
+        with codec.writer(stream) as fp:
+            while chunk := file_.stream.read(1024 * 1024):
+                if content_hash:
+                    content_hash.update(chunk)
+                fp.write(chunk)
+
+        stream.seek(0, os.SEEK_END)
+        storage_size = stream.tell()
+        stream.seek(0)
+        return stream, storage_size, content_hash.hexdigest() if content_hash else None
+
+    def _read_stream(self, fh: BinaryIO, codec: Codec) -> BinaryIO:
+        if isinstance(codec, NoneCodec):
+            return fh
+
+        stream = spooled_temporary_file()
+        with codec.reader(fh) as fp:
+            shutil.copyfileobj(fp, stream)
+        fh.close()
+        stream.seek(0)
+        return stream
 
     def _persist_files(
         self,
@@ -126,6 +362,8 @@ class DatasetStore:
         modified_files: Dict[str, Optional[DraftFile]],
     ) -> List[File]:
         modified_files_ = []
+        to_save = []
+        to_close = []
 
         current_revision = dataset.current_revision
 
@@ -143,26 +381,54 @@ class DatasetStore:
                 # File didn't change. Ignore it.
                 continue
 
-            stream, storage_size, suffix = self._prepare_write_stream(file_)
-
-            # TODO: check if this is a very clean way to go from DraftFile to File
-            full_path = self.file_repository.save_content(
-                bucket=self.bucket,
-                dataset=dataset,
-                revision_id=revision_id,
-                filename=file_id + "." + file_.data_serialization_format + suffix,
-                stream=stream,
+            codec = self.codec_selector.get_codec(file_.data_serialization_format)
+            stream, storage_size, content_hash = self._prepare_write_stream(
+                file_, codec
             )
+
+            extension = "." + file_.data_serialization_format + codec.suffix
+            if content_hash:
+                full_path = self.file_repository.get_blob_path(
+                    bucket=self.bucket,
+                    content_hash=content_hash,
+                    suffix=extension,
+                )
+                # Identical content is stored once, by any revision of any dataset
+                should_save = not self.file_repository.content_exists(full_path)
+            else:
+                # TODO: check if this is a very clean way to go from DraftFile to File
+                full_path = self.file_repository.get_path(
+                    bucket=self.bucket,
+                    dataset=dataset,
+                    revision_id=revision_id,
+                    filename=file_id + extension,
+                )
+                should_save = True
+
+            if should_save:
+                to_save.append((full_path, stream))
+            if stream is not file_.stream:
+                # Close the compressed copy (and its temporary file) once it's saved
+                to_close.append(stream)
+
             file = File.from_draft(
                 file_,
                 file_id,
                 storage_size=storage_size,
-                storage_compression_method=self.storage_compression_method,
+                storage_compression_method=codec.method,
                 path=self.file_repository.get_relative_path(full_path),
+                revision_id=revision_id,
             )
 
             modified_files_.append(file)
 
+        try:
+            # Save all files at once, so the repository can do it in parallel
+            self.file_repository.save_contents_by_path(to_save)
+        finally:
+            for stream in to_close:
+                stream.close()
+
         return modified_files_
 
     def add_revision(
@@ -172,6 +438,11 @@ class DatasetStore:
         Create new revision first, so FileRepository can use
         revision_id in the key.
         """
+        if dataset.is_summary:
+            raise IngestifyError(
+                f"Cannot add a revision to a summary of dataset {dataset.dataset_id}"
+            )
+
         revision_id = dataset.next_revision_id()
         created_at = utcnow()
 
@@ -189,7 +460,7 @@ class DatasetStore:
                 )
             )
 
-            self.dataset_repository.save(bucket=self.bucket, dataset=dataset)
+            self._save(dataset)
             self.dispatch(RevisionAdded(dataset=dataset))
             logger.info(
                 f"Added a new revision to {dataset.identifier} -> {', '.join([file.file_id for file in persisted_files_])}"
@@ -208,22 +479,45 @@ class DatasetStore:
         files: Dict[str, DraftFile],
     ):
         """The add_revision will also save the dataset."""
-        metadata_changed = False
-        if dataset.update_from_identifier(dataset_identifier):
-            self.dataset_repository.save(bucket=self.bucket, dataset=dataset)
-            metadata_changed = True
+        metadata_changed = dataset.update_from_identifier(dataset_identifier)
 
-        self.add_revision(dataset, files)
+        revision_added = self.add_revision(dataset, files)
 
         if metadata_changed:
+            if not revision_added:
+                self._save(dataset)
             # Dispatch after revision added. Otherwise, the downstream handlers are not able to see
             # the new revision
             self.dispatch(MetadataUpdated(dataset=dataset))
 
     def destroy_dataset(self, dataset: Dataset):
-        # TODO: remove files. Now we leave some orphaned files around
+        """
+        Remove the dataset, and the files no other dataset uses.
+
+        In the content-addressed layout a write that runs at the same time can find a
+        blob of this dataset, skip the upload, and reference it after it's deleted
+        here. Don't destroy datasets while an ingestion writes to the same bucket.
+        """
+        self.flush()
+        storage_paths = {
+            file.storage_path
+            for revision in dataset.revisions
+            for file in revision.modified_files
+            if file.storage_path
+        }
         self.dataset_repository.destroy(dataset)
 
+        # Remove the files that are not used by any other dataset anymore. In the
+        # content-addressed layout a blob can be used by multiple datasets.
+        reference_counts = self.dataset_repository.get_storage_path_reference_counts(
+            list(storage_paths)
+        )
+        for storage_path in storage_paths:
+            if not reference_counts.get(storage_path):
+                self.file_repository.delete_content(
+                    self.file_repository.get_absolute_path(storage_path)
+                )
+
     def create_dataset(
         self,
         dataset_type: str,
@@ -256,31 +550,64 @@ class DatasetStore:
         data_feed_keys: Optional[List[str]] = None,
         lazy: bool = False,
         auto_rewind: bool = True,
+        streaming: bool = False,
     ) -> FileCollection:
+        """
+        Load the files of the current revision of a dataset.
+
+        By default, every file is decompressed completely before it's returned. With
+        `streaming` the stream of a file decompresses while it's read, so memory usage
+        doesn't depend on the size of the file. Seeking backward opens the file again.
+        """
         current_revision = dataset.current_revision
         files = {}
 
-        reader, suffix = self._prepare_read_stream()
-        for file in current_revision.modified_files:
-            if data_feed_keys and file.data_feed_key not in data_feed_keys:
-                continue
+        files_to_load = [
+            file
+            for file in current_revision.modified_files
+            if not data_feed_keys or file.data_feed_key in data_feed_keys
+        ]
+
+        contents = {}
+        if not lazy and not streaming:
+            # Load all files at once, so the repository can do it in parallel
+            stored_files = [file for file in files_to_load if file.storage_path]
+            contents = dict(
+                zip(
+                    [file.file_id for file in stored_files],
+                    self.file_repository.load_files_content(stored_files),
+                )
+            )
+
+        for file in files_to_load:
 
             def get_stream(file_):
-                revision_id = file_.revision_id
-                if revision_id is None:
-                    revision_id = current_revision.revision_id
+                revision_id = current_revision.get_file_revision_id(file_.file_id)
 
-                return reader(
-                    self.file_repository.load_content(
+                # Use the codec the file was stored with
+                codec = get_codec(file_.storage_compression_method)
+
+                def open_content():
+                    if file_.storage_path:
+                        return self.file_repository.load_file_content(file_)
+                    return self.file_repository.load_content(
                         bucket=self.bucket,
                         dataset=dataset,
-                        # When file.revision_id is set we must use it.
+                        # The file can be stored by an older revision
                         revision_id=revision_id,
                         filename=file_.file_id
                         + "."
                         + file_.data_serialization_format
-                        + suffix,
+                        + codec.suffix,
+                    )
+
+                if streaming:
+                    return io.BufferedReader(
+                        DecompressingStream(open_content, codec),
+                        buffer_size=1024 * 1024,
                     )
+                return self._read_stream(
+                    contents.pop(file_.file_id, None) or open_content(), codec
                 )
 
             loaded_file = LoadedFile(
@@ -290,8 +617,35 @@ class DatasetStore:
             files[file.file_id] = loaded_file
         return FileCollection(files, auto_rewind=auto_rewind)
 
+    def load_files_many(
+        self,
+        dataset_collection: Union[DatasetCollection, Iterable[Dataset]],
+        data_feed_keys: Optional[List[str]] = None,
+        max_workers: Optional[int] = None,
+        ordered: bool = True,
+        **kwargs,
+    ) -> Iterator[Tuple[Dataset, FileCollection]]:
+        """
+        Load the files of many datasets, using up to `max_workers` threads (default
+        `INGESTIFY_LOAD_CONCURRENCY` or 8). Yields `(dataset, files)` in the order of
+        `dataset_collection`, or as soon as they are loaded when `ordered` is False.
+
+        At most `max_workers` datasets are loaded ahead of the consumer.
+        """
+        if max_workers is None:
+            max_workers = int(os.environ.get("INGESTIFY_LOAD_CONCURRENCY", "8"))
+
+        def load(dataset: Dataset) -> Tuple[Dataset, FileCollection]:
+            return dataset, self.load_files(
+                dataset, data_feed_keys=data_feed_keys, **kwargs
+            )
+
+        map_fn = map_ordered if ordered else map_unordered
+        yield from map_fn(load, dataset_collection, max_workers=max_workers)
+
     def load_with_kloppy(self, dataset: Dataset, **kwargs):
-        files = self.load_files(dataset)
+        # Kloppy can start parsing while the files are decompressed
+        files = self.load_files(dataset, streaming=True)
         if dataset.provider == "statsbomb":
             from kloppy import statsbomb
 
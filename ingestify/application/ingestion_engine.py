@@ -21,8 +21,8 @@ class IngestionEngine:
     def add_extract_job(self, extract_job: ExtractJob):
         self.loader.add_extract_job(extract_job)
 
-    def load(self):
-        self.loader.collect_and_run()
+    def load(self, executor: Optional[str] = None):
+        self.loader.collect_and_run(executor=executor)
 
     def list_datasets(self, as_count: bool = False):
         """Consider moving this to DataStore"""
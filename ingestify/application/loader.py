@@ -1,12 +1,21 @@
+import asyncio
 import logging
+import os
 import platform
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from multiprocessing import set_start_method, cpu_count
-from typing import List
+from multiprocessing.util import Finalize
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from ingestify.domain.models import Dataset, Identifier, Selector, Source, Task, TaskSet
-from ingestify.utils import map_in_pool, TaskExecutor
+from ingestify.infra.fetch.rate_limiter import shared_rate_limiters
+from ingestify.utils import map_in_pool, get_task_executor, uses_worker_processes
 
 from .dataset_store import DatasetStore
+from .selector_cache import SelectorCache
 from ..domain.models.data_spec_version_collection import DataSpecVersionCollection
 from ..domain.models.extract_job import ExtractJob
 from ..exceptions import ConfigurationError
@@ -20,60 +29,153 @@ else:
 logger = logging.getLogger(__name__)
 
 
-class UpdateDatasetTask(Task):
+@dataclass
+class WorkerContext:
+    """Everything a task needs that is expensive to build, or to pickle, per task."""
+
+    store: DatasetStore
+    sources: Dict[str, Source]
+    # Send the datasets and events back to the main process, which writes them
+    single_writer: bool = False
+
+
+_worker_context: Optional[WorkerContext] = None
+
+
+def set_worker_context(worker_context: WorkerContext):
+    global _worker_context
+    _worker_context = worker_context
+
+
+def init_worker(worker_context: WorkerContext):
+    """
+    Initializer of a worker process. The DatasetStore (including the database engine)
+    and Sources are unpickled once per process instead of once per task.
+    """
+    set_worker_context(worker_context)
+
+    if worker_context.single_writer:
+        worker_context.store.outbox = []
+    else:
+        # Save the datasets that are still pending when the worker exits
+        Finalize(None, worker_context.store.flush, exitpriority=10)
+
+
+def get_worker_context() -> WorkerContext:
+    if _worker_context is None:
+        raise Exception("Worker context is not initialized")
+    return _worker_context
+
+
+class SourceTask(Task):
+    """Task that only references the Source (by name) and DatasetStore of the worker."""
+
+    def __init__(self, source_name: str):
+        self.source_name = source_name
+
+    @property
+    def source(self) -> Source:
+        return get_worker_context().sources[self.source_name]
+
+    @property
+    def store(self) -> DatasetStore:
+        return get_worker_context().store
+
+
+class UpdateDatasetTask(SourceTask):
     def __init__(
         self,
-        source: Source,
+        source_name: str,
         dataset: Dataset,
         dataset_identifier: Identifier,
         data_spec_versions: DataSpecVersionCollection,
-        store: DatasetStore,
     ):
-        self.source = source
-        self.dataset = dataset
+        super().__init__(source_name)
+        self.dataset_id = dataset.dataset_id
+        self.dataset_type = dataset.dataset_type
         self.dataset_identifier = dataset_identifier
         self.data_spec_versions = data_spec_versions
-        self.store = store
 
-    def run(self):
-        files = self.source.fetch_dataset_files(
-            self.dataset.dataset_type,
+        # The current revision of the summary is enough to fetch the files. A summary
+        # can't be updated: the complete dataset is loaded to store the files.
+        self._summary: Optional[Dataset] = dataset
+        self._dataset: Optional[Dataset] = None if dataset.is_summary else dataset
+
+    def __getstate__(self):
+        # Don't ship the Dataset, including all its Revisions and Files, to another
+        # process. The worker loads it from the DatasetStore when it needs it.
+        state = self.__dict__.copy()
+        state["_dataset"] = None
+        if self._summary is not None and not self._summary.is_summary:
+            state["_summary"] = None
+        return state
+
+    @property
+    def summary(self) -> Dataset:
+        if self._summary is None:
+            self._summary = self.store.get_dataset_collection(
+                dataset_type=self.dataset_type,
+                dataset_id=self.dataset_id,
+                select="summary",
+            ).first()
+        return self._summary
+
+    @property
+    def dataset(self) -> Dataset:
+        if self._dataset is None:
+            self._dataset = self.store.get_dataset_collection(
+                dataset_type=self.dataset_type, dataset_id=self.dataset_id
+            ).first()
+        return self._dataset
+
+    def fetch_files(self):
+        return self.source.fetch_dataset_files(
+            self.dataset_type,
             self.dataset_identifier,  # Use the new dataset_identifier as it's more up-to-date, and contains more info
             data_spec_versions=self.data_spec_versions,
-            current_revision=self.dataset.current_revision,
+            current_revision=self.summary.current_revision,
         )
+
+    def store_files(self, files):
         self.store.update_dataset(
             dataset=self.dataset,
             dataset_identifier=self.dataset_identifier,
             files=files,
         )
 
+    def run(self):
+        self.store_files(self.fetch_files())
+
+    async def run_async(self):
+        # Only the fetching runs outside the loop. The store is used from the loop only.
+        self.store_files(await asyncio.to_thread(self.fetch_files))
+
     def __repr__(self):
-        return f"UpdateDatasetTask({self.source} -> {self.dataset.identifier})"
+        return f"UpdateDatasetTask({self.source} -> {self.dataset_identifier})"
 
 
-class CreateDatasetTask(Task):
+class CreateDatasetTask(SourceTask):
     def __init__(
         self,
-        source: Source,
+        source_name: str,
         dataset_type: str,
         data_spec_versions: DataSpecVersionCollection,
         dataset_identifier: Identifier,
-        store: DatasetStore,
     ):
-        self.source = source
+        super().__init__(source_name)
         self.dataset_type = dataset_type
         self.data_spec_versions = data_spec_versions
         self.dataset_identifier = dataset_identifier
-        self.store = store
 
-    def run(self):
-        files = self.source.fetch_dataset_files(
+    def fetch_files(self):
+        return self.source.fetch_dataset_files(
             dataset_type=self.dataset_type,
             identifier=self.dataset_identifier,
             data_spec_versions=self.data_spec_versions,
             current_revision=None,
         )
+
+    def store_files(self, files):
         self.store.create_dataset(
             dataset_type=self.dataset_type,
             provider=self.source.provider,
@@ -81,6 +183,12 @@ class CreateDatasetTask(Task):
             files=files,
         )
 
+    def run(self):
+        self.store_files(self.fetch_files())
+
+    async def run_async(self):
+        self.store_files(await asyncio.to_thread(self.fetch_files))
+
     def __repr__(self):
         return f"CreateDatasetTask({self.source} -> {self.dataset_identifier})"
 
@@ -93,8 +201,9 @@ class Loader:
     def add_extract_job(self, extract_job: ExtractJob):
         self.extract_jobs.append(extract_job)
 
-    def collect_and_run(self):
-        total_dataset_count = 0
+    def collect_selectors(self) -> List[Tuple[ExtractJob, Selector]]:
+        # Discover selectors only once per Source and dataset_type
+        selector_cache = SelectorCache.from_env()
 
         # First collect all selectors, before discovering datasets
         selectors = {}
@@ -109,14 +218,8 @@ class Loader:
             ]
             if dynamic_selectors:
                 if hasattr(extract_job.source, "discover_selectors"):
-                    logger.debug(
-                        f"Discovering selectors from {extract_job.source.__class__.__name__}"
-                    )
-
-                    # TODO: consider making this lazy and fetch once per Source instead of
-                    #       once per ExtractJob
-                    all_selectors = extract_job.source.discover_selectors(
-                        extract_job.dataset_type
+                    all_selectors = selector_cache.get_selectors(
+                        extract_job.source, extract_job.dataset_type
                     )
                     extra_static_selectors = []
                     for dynamic_selector in dynamic_selectors:
@@ -153,96 +256,229 @@ class Loader:
                 else:
                     selectors[key] = (extract_job, selector)
 
-        def run_task(task):
-            logger.info(f"Running task {task}")
-            task.run()
+        return list(selectors.values())
 
-        task_executor = TaskExecutor()
+    def discover_task_sets(
+        self, extract_job: ExtractJob, selector: Selector
+    ) -> Iterator[TaskSet]:
+        """Discover datasets using a single selector, and yield a TaskSet per batch."""
+        logger.debug(
+            f"Discovering datasets from {extract_job.source.__class__.__name__} using selector {selector}"
+        )
 
-        for extract_job, selector in selectors.values():
-            logger.debug(
-                f"Discovering datasets from {extract_job.source.__class__.__name__} using selector {selector}"
-            )
+        dataset_collection_metadata = self.store.get_dataset_collection(
+            dataset_type=extract_job.dataset_type,
+            data_spec_versions=selector.data_spec_versions,
+            selector=selector,
+            metadata_only=True,
+        ).metadata
+
+        # There are two different, but similar flows here:
+        # 1. The discover_datasets returns a list, and the entire list can be processed at once
+        # 2. The discover_datasets returns an iterator of batches, in this case we need to process each batch
+        discovered_datasets = extract_job.source.discover_datasets(
+            dataset_type=extract_job.dataset_type,
+            data_spec_versions=selector.data_spec_versions,
+            dataset_collection_metadata=dataset_collection_metadata,
+            **selector.filtered_attributes,
+        )
 
-            dataset_collection_metadata = self.store.get_dataset_collection(
-                dataset_type=extract_job.dataset_type,
-                data_spec_versions=selector.data_spec_versions,
-                selector=selector,
-                metadata_only=True,
-            ).metadata
-
-            # There are two different, but similar flows here:
-            # 1. The discover_datasets returns a list, and the entire list can be processed at once
-            # 2. The discover_datasets returns an iterator of batches, in this case we need to process each batch
-            discovered_datasets = extract_job.source.discover_datasets(
+        if isinstance(discovered_datasets, list):
+            batches = [discovered_datasets]
+        else:
+            batches = discovered_datasets
+
+        for batch in batches:
+            dataset_identifiers = [
+                Identifier.create_from(selector, **identifier)
+                # We have to pass the data_spec_versions here as a Source can add some
+                # extra data to the identifier which is retrieved in a certain data format
+                for identifier in batch
+            ]
+
+            # Load all available datasets based on the discovered dataset identifiers
+            dataset_collection = self.store.get_dataset_collection(
                 dataset_type=extract_job.dataset_type,
-                data_spec_versions=selector.data_spec_versions,
-                dataset_collection_metadata=dataset_collection_metadata,
-                **selector.filtered_attributes,
+                provider=extract_job.source.provider,
+                selector=dataset_identifiers,
+                # The current files are enough to decide what to update
+                select="summary",
             )
 
-            if isinstance(discovered_datasets, list):
-                batches = [discovered_datasets]
-            else:
-                batches = discovered_datasets
-
-            for batch in batches:
-                dataset_identifiers = [
-                    Identifier.create_from(selector, **identifier)
-                    # We have to pass the data_spec_versions here as a Source can add some
-                    # extra data to the identifier which is retrieved in a certain data format
-                    for identifier in batch
-                ]
-
-                # Load all available datasets based on the discovered dataset identifiers
-                dataset_collection = self.store.get_dataset_collection(
-                    dataset_type=extract_job.dataset_type,
-                    provider=extract_job.source.provider,
-                    selector=dataset_identifiers,
-                )
-
-                skip_count = 0
-                total_dataset_count += len(dataset_identifiers)
-
-                task_set = TaskSet()
-                for dataset_identifier in dataset_identifiers:
-                    if dataset := dataset_collection.get(dataset_identifier):
-                        if extract_job.fetch_policy.should_refetch(
-                            dataset, dataset_identifier
-                        ):
-                            task_set.add(
-                                UpdateDatasetTask(
-                                    source=extract_job.source,
-                                    dataset=dataset,  # Current dataset from the database
-                                    dataset_identifier=dataset_identifier,  # Most recent dataset_identifier
-                                    data_spec_versions=selector.data_spec_versions,
-                                    store=self.store,
-                                )
+            skip_count = 0
+
+            task_set = TaskSet()
+            for dataset_identifier in dataset_identifiers:
+                if dataset := dataset_collection.get(dataset_identifier):
+                    if extract_job.fetch_policy.should_refetch(
+                        dataset, dataset_identifier
+                    ):
+                        task_set.add(
+                            UpdateDatasetTask(
+                                source_name=extract_job.source.name,
+                                dataset=dataset,  # Current dataset from the database
+                                dataset_identifier=dataset_identifier,  # Most recent dataset_identifier
+                                data_spec_versions=selector.data_spec_versions,
                             )
-                        else:
-                            skip_count += 1
+                        )
                     else:
-                        if extract_job.fetch_policy.should_fetch(dataset_identifier):
-                            task_set.add(
-                                CreateDatasetTask(
-                                    source=extract_job.source,
-                                    dataset_type=extract_job.dataset_type,
-                                    dataset_identifier=dataset_identifier,
-                                    data_spec_versions=selector.data_spec_versions,
-                                    store=self.store,
-                                )
+                        skip_count += 1
+                else:
+                    if extract_job.fetch_policy.should_fetch(dataset_identifier):
+                        task_set.add(
+                            CreateDatasetTask(
+                                source_name=extract_job.source.name,
+                                dataset_type=extract_job.dataset_type,
+                                dataset_identifier=dataset_identifier,
+                                data_spec_versions=selector.data_spec_versions,
                             )
-                        else:
-                            skip_count += 1
-
-                logger.info(
-                    f"Discovered {len(dataset_identifiers)} datasets from {extract_job.source.__class__.__name__} "
-                    f"using selector {selector} => {len(task_set)} tasks. {skip_count} skipped."
-                )
+                        )
+                    else:
+                        skip_count += 1
 
-                task_executor.run(run_task, task_set)
-                logger.info(f"Scheduled {len(task_set)} tasks")
+            logger.info(
+                f"Discovered {len(dataset_identifiers)} datasets from {extract_job.source.__class__.__name__} "
+                f"using selector {selector} => {len(task_set)} tasks. {skip_count} skipped."
+            )
+            yield task_set
+
+    def discover_task_sets_pipelined(
+        self, selectors: List[Tuple[ExtractJob, Selector]], concurrency: int
+    ) -> Iterator[TaskSet]:
+        """
+        Discover datasets for `concurrency` selectors at the same time, in background
+        threads. The TaskSets are yielded as soon as they are available, so they can be
+        executed while discovery continues.
+
+        The queue between discovery and execution is bounded: discovery is paused when
+        execution can't keep up.
+        """
+        task_set_queue = queue.Queue(maxsize=concurrency * 2)
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    task_set_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def discover(extract_job: ExtractJob, selector: Selector):
+            try:
+                for task_set in self.discover_task_sets(extract_job, selector):
+                    if not put(task_set):
+                        return
+            except Exception as e:
+                put(e)
+            finally:
+                put(done)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            try:
+                for extract_job, selector in selectors:
+                    executor.submit(discover, extract_job, selector)
+
+                pending = len(selectors)
+                while pending:
+                    item = task_set_queue.get()
+                    if item is done:
+                        pending -= 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        yield item
+            finally:
+                stop.set()
+
+    def use_single_writer(self) -> bool:
+        """
+        Whether worker processes should leave the writes to the main process. Set
+        `INGESTIFY_SINGLE_WRITER` to 'true' or 'false'. By default, it's enabled when
+        the DatasetRepository prefers a single writer, like SQLite does.
+        """
+        single_writer = os.environ.get("INGESTIFY_SINGLE_WRITER", "auto")
+        if single_writer == "auto":
+            return self.store.dataset_repository.prefers_single_writer
+        return single_writer == "true"
+
+    def collect_and_run(self, executor: Optional[str] = None):
+        selectors = self.collect_selectors()
+
+        worker_context = WorkerContext(
+            store=self.store,
+            sources={
+                extract_job.source.name: extract_job.source
+                for extract_job in self.extract_jobs
+            },
+            single_writer=self.use_single_writer(),
+        )
+        # Tasks that run in this process (eager, threads, async) use the context directly.
+        # Worker processes get their own copy, once, from the initializer.
+        set_worker_context(worker_context)
+
+        rate_limiters = []
+        if uses_worker_processes(executor):
+            # Apply the limits over all worker processes together
+            rate_limiters = [
+                source.rate_limiter
+                for source in worker_context.sources.values()
+                if source.rate_limiter
+            ]
 
-        task_executor.join()
+        with shared_rate_limiters(rate_limiters):
+            task_executor = get_task_executor(
+                executor,
+                initializer=init_worker,
+                initargs=(worker_context,),
+            )
+            self._run(task_executor, selectors)
 
         logger.info("Done")
+
+    def _run(self, task_executor, selectors: List[Tuple[ExtractJob, Selector]]):
+        def run_task(task):
+            logger.info(f"Running task {task}")
+            task.run()
+
+            store = get_worker_context().store
+            if store.outbox is not None:
+                return store.take_outbox()
+
+        async def run_task_async(task):
+            logger.info(f"Running task {task}")
+            await task.run_async()
+
+        if os.environ.get("INGESTIFY_RUN_EAGER") == "true":
+            # Discover and run every batch right away
+            discovery_concurrency = 0
+        else:
+            discovery_concurrency = int(
+                os.environ.get("INGESTIFY_DISCOVERY_CONCURRENCY", "1")
+            )
+
+        if discovery_concurrency > 0:
+            task_sets = self.discover_task_sets_pipelined(
+                selectors, discovery_concurrency
+            )
+        else:
+            task_sets = (
+                task_set
+                for extract_job, selector in selectors
+                for task_set in self.discover_task_sets(extract_job, selector)
+            )
+
+        for task_set in task_sets:
+            task_executor.run(
+                run_task_async if task_executor.is_async else run_task,
+                task_set,
+                # The single writer: save the datasets and events of the workers
+                on_result=self.store.write_outbox,
+            )
+            logger.info(f"Scheduled {len(task_set)} tasks")
+
+        task_executor.join()
+        # Tasks that ran in this process, or the single writer, can have pending writes
+        self.store.flush()
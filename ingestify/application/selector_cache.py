@@ -0,0 +1,84 @@
+import json
+import logging
+import os
+import re
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from ingestify.domain.models import Source
+
+logger = logging.getLogger(__name__)
+
+
+class SelectorCache:
+    """
+    Cache the result of `Source.discover_selectors` per (source name, dataset_type).
+
+    Within a run every combination is discovered only once. When a `cache_dir` is
+    passed the result is also stored on disk, and reused by other runs for `ttl`
+    seconds.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, ttl: int = 3600):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.ttl = ttl
+        self._selectors: Dict[Tuple[str, str], List[Dict]] = {}
+
+    @classmethod
+    def from_env(cls) -> "SelectorCache":
+        return cls(
+            cache_dir=os.environ.get("INGESTIFY_SELECTOR_CACHE_DIR"),
+            ttl=int(os.environ.get("INGESTIFY_SELECTOR_CACHE_TTL", "3600")),
+        )
+
+    def _get_path(self, key: Tuple[str, str]) -> Path:
+        filename = re.sub(r"[^\w\-]", "_", "__".join(key))
+        return self.cache_dir / f"{filename}.json"
+
+    def _load(self, key: Tuple[str, str]) -> Optional[List[Dict]]:
+        if not self.cache_dir:
+            return None
+
+        path = self._get_path(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                return None
+
+            with open(path, "r") as fp:
+                return json.load(fp)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _save(self, key: Tuple[str, str], selectors: List[Dict]):
+        if not self.cache_dir:
+            return
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._get_path(key)
+        # Write to a temporary file first so other runs never see a partial file
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "w") as fp:
+                json.dump(selectors, fp)
+            os.replace(tmp_path, path)
+        except TypeError:
+            logger.warning(
+                f"Selectors of {key[0]} can't be stored as json. Not caching them on disk."
+            )
+            tmp_path.unlink(missing_ok=True)
+
+    def get_selectors(self, source: Source, dataset_type: str) -> List[Dict]:
+        key = (source.name, dataset_type)
+        if key not in self._selectors:
+            selectors = self._load(key)
+            if selectors is None:
+                logger.debug(f"Discovering selectors from {source.__class__.__name__}")
+                selectors = source.discover_selectors(dataset_type)
+                self._save(key, selectors)
+            else:
+                logger.debug(
+                    f"Using cached selectors of {source.__class__.__name__} from disk"
+                )
+            self._selectors[key] = selectors
+        return self._selectors[key]
@@ -57,8 +57,20 @@ def cli():
     help="bucket",
     type=str,
 )
+@click.option(
+    "--executor",
+    "executor",
+    required=False,
+    help="How to run the tasks. Defaults to INGESTIFY_EXECUTOR or 'processes'",
+    type=click.Choice(["processes", "threads", "async"]),
+)
 @click.option("--debug", "debug", required=False, help="Debugging enabled", type=bool)
-def run(config_file: str, bucket: Optional[str], debug: Optional[bool]):
+def run(
+    config_file: str,
+    bucket: Optional[str],
+    executor: Optional[str],
+    debug: Optional[bool],
+):
     try:
         engine = get_engine(config_file, bucket)
     except ConfigurationError as e:
@@ -68,7 +80,7 @@ def run(config_file: str, bucket: Optional[str], debug: Optional[bool]):
             logger.exception(f"Failed due a configuration error: {e}")
             sys.exit(1)
 
-    engine.load()
+    engine.load(executor=executor)
 
     logger.info("Done")
 
@@ -46,12 +46,21 @@ class Dataset:
     def is_complete(self):
         return self.state.is_complete
 
+    @property
+    def is_summary(self) -> bool:
+        """
+        A summary only contains the current (squashed) revision instead of all
+        revisions. It can be used to decide what to do, but not to add revisions to.
+        """
+        return bool(self.revisions) and self.revisions[-1].is_squashed
+
     def next_revision_id(self):
         return len(self.revisions)
 
     def add_revision(self, revision: Revision):
         self.revisions.append(revision)
         self.updated_at = utcnow()
+        self._current_revision = None
 
     def update_from_identifier(self, dataset_identifier: Identifier) -> bool:
         changed = False
@@ -77,28 +86,49 @@ class Dataset:
         """
         When multiple versions are available, squash versions into one single version which
         contents all most recent files.
+
+        The squashed revision is cached until a revision is added. Don't modify it.
         """
         if not self.revisions:
             return None
         elif len(self.revisions) == 1:
             return self.revisions[0]
-        else:
-            files = {}
-
-            for revision in self.revisions:
-                for file_id, file in revision.modified_files_map.items():
-                    if isinstance(file, DraftFile):
-                        raise Exception(
-                            f"Cannot squash draft file. Revision: {revision}. FileId: {file_id}"
-                        )
-                    files[file_id] = file
-                    files[file_id].revision_id = revision.revision_id
-
-            return Revision(
-                revision_id=self.revisions[-1].revision_id,
-                created_at=self.revisions[-1].created_at,
-                # created_at=max([file.modified_at for file in files.values()]),
-                description="Squashed revision",
-                is_squashed=True,
-                modified_files=list(files.values()),
-            )
+
+        # Datasets loaded by a repository don't go through __init__
+        cached = getattr(self, "_current_revision", None)
+        if (
+            cached is None
+            or cached[0] != len(self.revisions)
+            or cached[1] is not self.revisions[-1]
+        ):
+            cached = (len(self.revisions), self.revisions[-1], self._squash_revisions())
+            self._current_revision = cached
+        return cached[2]
+
+    def _squash_revisions(self) -> Revision:
+        files = {}
+        file_revision_ids = {}
+
+        for revision in self.revisions:
+            for file in revision.modified_files:
+                if isinstance(file, DraftFile):
+                    raise Exception(
+                        f"Cannot squash draft file. Revision: {revision}. FileId: {file.file_id}"
+                    )
+                # The files are shared with the revisions, so don't modify them
+                files[file.file_id] = file
+                file_revision_ids[file.file_id] = (
+                    file.revision_id
+                    if file.revision_id is not None
+                    else revision.revision_id
+                )
+
+        return Revision(
+            revision_id=self.revisions[-1].revision_id,
+            created_at=self.revisions[-1].created_at,
+            # created_at=max([file.modified_at for file in files.values()]),
+            description="Squashed revision",
+            is_squashed=True,
+            modified_files=list(files.values()),
+            file_revision_ids=file_revision_ids,
+        )
@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-from typing import Optional, List, Union
+from pathlib import Path
+from typing import Dict, Optional, List, Tuple, Union
 
 from ingestify.utils import ComponentFactory, ComponentRegistry
 
@@ -11,6 +12,10 @@ dataset_repository_registry = ComponentRegistry()
 
 
 class DatasetRepository(ABC, metaclass=dataset_repository_registry.metaclass):
+    # Whether concurrent writers block each other, so it's better to let a single
+    # process do all writes.
+    prefers_single_writer = False
+
     @abstractmethod
     def get_dataset_collection(
         self,
@@ -20,7 +25,12 @@ class DatasetRepository(ABC, metaclass=dataset_repository_registry.metaclass):
         provider: Optional[str] = None,
         selector: Optional[Union[Selector, List[Selector]]] = None,
         metadata_only: bool = False,
+        select: str = "full",
     ) -> DatasetCollection:
+        """
+        With `select="full"` the datasets contain all revisions. With
+        `select="summary"` they only contain the current, squashed revision.
+        """
         pass
 
     @abstractmethod
@@ -31,6 +41,34 @@ class DatasetRepository(ABC, metaclass=dataset_repository_registry.metaclass):
     def save(self, bucket: str, dataset: Dataset):
         pass
 
+    def save_many(
+        self, bucket: str, datasets: List[Dataset]
+    ) -> List[Tuple[Dataset, Exception]]:
+        """
+        Save multiple datasets. Repositories can save them in a single transaction.
+
+        A dataset that can't be saved doesn't stop the others. The datasets that
+        failed are returned, with their exception.
+        """
+        failed = []
+        for dataset in datasets:
+            try:
+                self.save(bucket=bucket, dataset=dataset)
+            except Exception as e:
+                failed.append((dataset, e))
+        return failed
+
+    def get_storage_path_reference_counts(
+        self, storage_paths: List[Path]
+    ) -> Dict[Path, int]:
+        """
+        Return how many files are stored at each of the storage paths.
+
+        By default every path is reported as used, so no content is deleted by a
+        repository that can't count the references.
+        """
+        return {storage_path: 1 for storage_path in storage_paths}
+
     @abstractmethod
     def next_identity(self):
         pass
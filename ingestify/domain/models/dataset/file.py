@@ -95,6 +95,7 @@ class File:
         storage_size: int,
         storage_compression_method,
         path: Path,
+        revision_id: Optional[int] = None,
     ) -> "File":
         return cls(
             file_id=file_id,
@@ -109,6 +110,7 @@ class File:
             storage_size=storage_size,
             storage_compression_method=storage_compression_method,
             storage_path=path,
+            revision_id=revision_id,
         )
 
 
@@ -1,10 +1,11 @@
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import BinaryIO
+from typing import BinaryIO, List, Tuple
 
 from ingestify.utils import ComponentFactory, ComponentRegistry
 
 from .dataset import Dataset
+from .file import File
 
 file_repository_registry = ComponentRegistry()
 
@@ -30,6 +31,34 @@ class FileRepository(ABC, metaclass=file_repository_registry.metaclass):
     ) -> BinaryIO:
         pass
 
+    @abstractmethod
+    def save_content_by_path(self, path: Path, stream: BinaryIO) -> Path:
+        pass
+
+    @abstractmethod
+    def load_content_by_path(self, path: Path) -> BinaryIO:
+        pass
+
+    def load_file_content(self, file: File) -> BinaryIO:
+        """Load the content of a stored File"""
+        return self.load_content_by_path(self.get_absolute_path(file.storage_path))
+
+    def save_contents_by_path(self, items: List[Tuple[Path, BinaryIO]]) -> List[Path]:
+        """Save multiple files. Repositories can override this to save in parallel."""
+        return [self.save_content_by_path(path, stream) for path, stream in items]
+
+    def load_files_content(self, files: List[File]) -> List[BinaryIO]:
+        """Load multiple files. Repositories can override this to load in parallel."""
+        return [self.load_file_content(file) for file in files]
+
+    @abstractmethod
+    def content_exists(self, path: Path) -> bool:
+        pass
+
+    @abstractmethod
+    def delete_content(self, path: Path):
+        pass
+
     @classmethod
     @abstractmethod
     def supports(cls, url: str) -> bool:
@@ -49,6 +78,21 @@ class FileRepository(ABC, metaclass=file_repository_registry.metaclass):
         )
         return path
 
+    def get_blob_path(self, bucket: str, content_hash: str, suffix: str) -> Path:
+        """Return the path of a blob in the content-addressed layout"""
+        return (
+            self.base_dir
+            / bucket
+            / "blobs"
+            / content_hash[:2]
+            / content_hash[2:4]
+            / f"{content_hash}{suffix}"
+        )
+
+    def get_absolute_path(self, path: Path) -> Path:
+        """Return the path including the base of the repository"""
+        return self.base_dir / path
+
     def get_relative_path(self, path: Path) -> Path:
         """Return the relative path to the base of the repository"""
         return path.relative_to(self.base_dir)
@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from .file import File
 
@@ -12,10 +12,35 @@ class Revision:
     description: str
     modified_files: List[File]
     is_squashed: bool = False
+    # A squashed revision holds files of older revisions: file_id -> revision_id
+    file_revision_ids: Optional[Dict[str, int]] = None
 
     @property
     def modified_files_map(self) -> Dict[str, File]:
-        return {file.file_id: file for file in self.modified_files}
+        # Revisions loaded by a repository don't go through __init__
+        cached = getattr(self, "_modified_files_map", None)
+        if (
+            cached is None
+            or cached[0] is not self.modified_files
+            or cached[1] != len(self.modified_files)
+        ):
+            cached = (
+                self.modified_files,
+                len(self.modified_files),
+                {file.file_id: file for file in self.modified_files},
+            )
+            self._modified_files_map = cached
+        return cached[2]
+
+    def get_file_revision_id(self, file_id: str) -> int:
+        """The revision the file was added in."""
+        # Revisions loaded by a repository don't go through __init__
+        file_revision_ids = getattr(self, "file_revision_ids", None)
+        if file_revision_ids and file_id in file_revision_ids:
+            return file_revision_ids[file_id]
+
+        revision_id = self.modified_files_map[file_id].revision_id
+        return revision_id if revision_id is not None else self.revision_id
 
     def is_changed(self, files: Dict[str, datetime]) -> bool:
         modified_files_map = self.modified_files_map
@@ -0,0 +1,148 @@
+import logging
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Limit the requests made to a single provider, using a token bucket for the request
+    rate and a maximum number of requests in flight.
+
+    The state of the limiter lives in this process. Every process that unpickles the
+    limiter gets its own copy, unless the state is moved to a shared backend with
+    `use_state` first.
+
+    When `adaptive` is enabled the allowed concurrency is controlled using AIMD: it's
+    increased by one for every "window" of successful requests, and halved when the
+    provider responds with a 429/503 or when the latency exceeds `target_latency`.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: Optional[float] = None,
+        burst: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        adaptive: bool = False,
+        target_latency: Optional[float] = None,
+    ):
+        if adaptive and not max_concurrency:
+            max_concurrency = 64
+
+        self.requests_per_second = requests_per_second
+        self.burst = burst or max(1, int(requests_per_second or 1))
+        self.max_concurrency = max_concurrency
+        self.adaptive = adaptive
+        self.target_latency = target_latency
+
+        self.use_state(
+            dict(
+                tokens=float(self.burst),
+                updated_at=time.time(),
+                in_flight=0,
+                # Start slow when adaptive, and let AIMD find the right concurrency
+                concurrency=float(
+                    min(4, max_concurrency) if adaptive else max_concurrency or 0
+                ),
+            )
+        )
+
+    def use_state(self, state, condition=None):
+        """
+        Keep the state in `state` (a dict-like) and synchronize on `condition`. Pass
+        a shared dict and condition to apply the limits over multiple processes.
+        """
+        self._state = state
+        self._condition = condition or threading.Condition()
+
+    @property
+    def state(self) -> dict:
+        with self._condition:
+            return self._state.copy()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if isinstance(self._state, dict):
+            # Not shared: the copy gets its own lock
+            state["_condition"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._condition is None:
+            self._condition = threading.Condition()
+
+    @property
+    def concurrency(self) -> float:
+        return self._state["concurrency"]
+
+    def _try_acquire(self) -> Optional[float]:
+        """
+        Take a slot when possible and return 0. Otherwise, return how long to wait for
+        the next token, or None when the wait is for a request to finish.
+        """
+        state = self._state.copy()
+
+        now = time.time()
+        if self.requests_per_second:
+            state["tokens"] = min(
+                float(self.burst),
+                state["tokens"]
+                + (now - state["updated_at"]) * self.requests_per_second,
+            )
+        state["updated_at"] = now
+
+        wait = 0.0
+        if self.max_concurrency and state["in_flight"] >= int(state["concurrency"]):
+            wait = None
+        elif self.requests_per_second and state["tokens"] < 1:
+            wait = (1 - state["tokens"]) / self.requests_per_second
+        else:
+            state["tokens"] -= 1
+            state["in_flight"] += 1
+
+        self._state.update(state)
+        return wait
+
+    def acquire(self):
+        with self._condition:
+            while (wait := self._try_acquire()) != 0:
+                # Sleep until the next token is available, or until `release` is called
+                self._condition.wait(wait)
+
+    def release(
+        self,
+        status_code: Optional[int] = None,
+        latency: Optional[float] = None,
+        failed: bool = False,
+    ):
+        """Release the slot. The outcome of the request is used by the adaptive mode."""
+        with self._condition:
+            state = self._state.copy()
+            state["in_flight"] -= 1
+
+            if self.adaptive:
+                if (
+                    failed
+                    or status_code in (429, 503)
+                    or (
+                        self.target_latency
+                        and latency is not None
+                        and latency > self.target_latency
+                    )
+                ):
+                    state["concurrency"] = max(1.0, state["concurrency"] / 2)
+                    logger.debug(
+                        f"Decreased concurrency to {int(state['concurrency'])} "
+                        f"(status={status_code}, latency={latency})"
+                    )
+                elif not status_code or status_code < 400:
+                    state["concurrency"] = min(
+                        float(self.max_concurrency),
+                        state["concurrency"] + 1 / state["concurrency"],
+                    )
+
+            self._state.update(state)
+            self._condition.notify_all()
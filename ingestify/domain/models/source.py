@@ -7,9 +7,14 @@ from . import DraftFile
 from .data_spec_version_collection import DataSpecVersionCollection
 from .dataset import Identifier, Revision
 from .dataset.collection_metadata import DatasetCollectionMetadata
+from .rate_limiter import RateLimiter
 
 
 class Source(ABC):
+    # Set from the `rate_limit` configuration of the source. Sources should pass it
+    # to `retrieve_http`.
+    rate_limiter: Optional[RateLimiter] = None
+
     def __init__(self, name: str, **kwargs):
         self.name = name
 
@@ -5,3 +5,7 @@ class Task(ABC):
     @abstractmethod
     def run(self):
         pass
+
+    async def run_async(self):
+        """Run the task from an event loop. By default this just runs the task."""
+        return self.run()
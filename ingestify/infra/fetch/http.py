@@ -1,22 +1,237 @@
+import asyncio
+import itertools
 import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
 from datetime import datetime
 from email.utils import format_datetime, parsedate
 from hashlib import sha1
-from io import BytesIO
-from typing import Optional, Callable, Tuple
+from typing import Optional, Callable, Tuple, Union, Iterator
+from urllib.parse import urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from ingestify.domain.models import DraftFile, File
-from ingestify.utils import utcnow
+from ingestify.domain.models.rate_limiter import RateLimiter
+from ingestify.utils import utcnow, spooled_temporary_file, map_ordered
+
+from .retry import RetryPolicy, get_circuit_breaker
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """
+    Return the `requests.Session` shared by all requests made within this process.
+
+    The session keeps a connection pool per host, so connections (and TLS handshakes) are
+    reused between files. The pool is bounded by `INGESTIFY_HTTP_POOL_SIZE`: when all
+    connections to a host are in use, the next request waits for one to be released.
+    """
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            # A forked worker must not share the sockets of its parent
+            if _session is None or _session_pid != pid:
+                pool_size = int(os.environ.get("INGESTIFY_HTTP_POOL_SIZE", "32"))
+                adapter = HTTPAdapter(
+                    pool_connections=pool_size,
+                    pool_maxsize=pool_size,
+                    pool_block=True,
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+
+                _session = session
+                _session_pid = pid
+    return _session
+
+
+def _get(
+    session: requests.Session,
+    url,
+    rate_limiter: Optional[RateLimiter] = None,
+    **kwargs,
+) -> requests.Response:
+    if not rate_limiter:
+        return session.get(url, **kwargs)
+
+    rate_limiter.acquire()
+    start = time.time()
+    response = None
+    try:
+        response = session.get(url, **kwargs)
+        return response
+    finally:
+        rate_limiter.release(
+            status_code=response.status_code if response is not None else None,
+            latency=time.time() - start,
+            failed=response is None,
+        )
+
+
+def http_get(
+    url,
+    rate_limiter: Optional[RateLimiter] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+    **kwargs,
+) -> requests.Response:
+    """
+    Do a GET request using the shared session, within the limits of `rate_limiter`.
+
+    Connection errors and responses with a status in `retry_policy.retry_statuses` are
+    retried. When all attempts fail, the last response is returned (or the last
+    exception is raised).
+    """
+    retry_policy = retry_policy or RetryPolicy.from_env()
+    session = get_http_session()
+    circuit_breaker = get_circuit_breaker(urlparse(url).netloc, retry_policy)
+
+    for attempt in range(retry_policy.max_attempts):
+        is_last_attempt = attempt == retry_policy.max_attempts - 1
+
+        circuit_breaker.check()
+        try:
+            response = _get(session, url, rate_limiter, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            circuit_breaker.record_failure()
+            if is_last_attempt:
+                raise
+
+            backoff = retry_policy.get_backoff(attempt)
+            logger.warning(f"Request to {url} failed: {e}. Retrying in {backoff:.1f}s")
+            time.sleep(backoff)
+            continue
+
+        if response.status_code not in retry_policy.retry_statuses:
+            circuit_breaker.record_success()
+            return response
+
+        if response.status_code >= 500:
+            # A 429 means we are too fast, not that the host is down
+            circuit_breaker.record_failure()
+
+        if is_last_attempt:
+            return response
+
+        backoff = retry_policy.get_backoff(attempt, response)
+        logger.warning(
+            f"Request to {url} returned {response.status_code}. Retrying in {backoff:.1f}s"
+        )
+        response.close()
+        time.sleep(backoff)
+
+
+@dataclass
+class Pager:
+    """
+    A pager for APIs that tell the number of pages in the first response.
+
+    After the first page is received, the other pages are fetched concurrently (at most
+    `max_workers` at the same time, default `INGESTIFY_PAGE_CONCURRENCY` or 8).
+
+    `page_count` returns the number of pages from the data of the first page, and
+    `page_url` returns the url of a page (starting at 1) based on the original url.
+    """
+
+    data_path: str
+    page_count: Callable[[dict], int]
+    page_url: Callable[[str, int], str]
+    max_workers: Optional[int] = None
+
+
+def _iter_paged_content(
+    url,
+    response: requests.Response,
+    pager: Union[Pager, Tuple[str, Callable[[str, dict], Optional[str]]]],
+    rate_limiter: Optional[RateLimiter],
+    retry_policy: Optional[RetryPolicy],
+    headers: dict,
+    http_kwargs: dict,
+) -> Iterator[bytes]:
+    """
+    Yield the items of all pages as `{"<data_path>": [item, ...]}`. The output is
+    identical to `json.dumps` of all data, without keeping all pages in memory.
+    """
+
+    # The etag of the first page is for the first page only
+    page_headers = {k: v for k, v in headers.items() if k != "if-none-match"}
+
+    def get_page_data(page_url: str) -> dict:
+        page_response = http_get(
+            page_url, rate_limiter, retry_policy, headers=page_headers, **http_kwargs
+        )
+        with page_response:
+            page_response.raise_for_status()
+            return page_response.json()
+
+    if isinstance(pager, Pager):
+        data_path = pager.data_path
+        first_page_data = response.json()
+        max_workers = pager.max_workers or int(
+            os.environ.get("INGESTIFY_PAGE_CONCURRENCY", "8")
+        )
+        pages = itertools.chain(
+            [first_page_data],
+            map_ordered(
+                get_page_data,
+                [
+                    pager.page_url(url, page)
+                    for page in range(2, pager.page_count(first_page_data) + 1)
+                ],
+                max_workers=max_workers,
+            ),
+        )
+    else:
+        # A pager function returns the url of the next page, so pages are fetched
+        # one by one.
+        data_path, pager_fn = pager
+
+        def iter_pages():
+            page_data = response.json()
+            while True:
+                yield page_data
+                next_url = pager_fn(url, page_data)
+                if not next_url:
+                    break
+                page_data = get_page_data(next_url)
+
+        pages = iter_pages()
+
+    yield b"{" + json.dumps(data_path).encode("utf-8") + b": ["
+    is_first = True
+    for page_data in pages:
+        for item in page_data[data_path]:
+            if not is_first:
+                yield b", "
+            yield json.dumps(item).encode("utf-8")
+            is_first = False
+    yield b"]}"
 
 
 def retrieve_http(
     url,
     current_file: Optional[File] = None,
     headers: Optional[dict] = None,
-    pager: Optional[Tuple[str, Callable[[str, dict], Optional[str]]]] = None,
+    pager: Optional[
+        Union[Pager, Tuple[str, Callable[[str, dict], Optional[str]]]]
+    ] = None,
     last_modified: Optional[datetime] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    retry_policy: Optional[RetryPolicy] = None,
     **kwargs,
 ) -> Optional[DraftFile]:
     headers = headers or {}
@@ -41,52 +256,56 @@ def retrieve_http(
         else:
             raise Exception(f"Don't know how to use {key}")
 
-    response = requests.get(url, headers=headers, **http_kwargs)
-    response.raise_for_status()
-    if response.status_code == 304:
-        # Not modified
-        return None
+    response = http_get(
+        url, rate_limiter, retry_policy, headers=headers, stream=True, **http_kwargs
+    )
+    try:
+        response.raise_for_status()
+        if response.status_code == 304:
+            # Not modified
+            return None
 
-    if last_modified:
-        # From metadata received from api in discover_datasets
-        modified_at = last_modified
-    elif "last-modified" in response.headers:
-        # Received from the webserver
-        modified_at = parsedate(response.headers["last-modified"])
-    else:
-        modified_at = utcnow()
+        if last_modified:
+            # From metadata received from api in discover_datasets
+            modified_at = last_modified
+        elif "last-modified" in response.headers:
+            # Received from the webserver
+            modified_at = parsedate(response.headers["last-modified"])
+        else:
+            modified_at = utcnow()
 
-    tag = response.headers.get("etag")
-    # content_length = int(response.headers.get("content-length", 0))
+        tag = response.headers.get("etag")
+        content_type = response.headers.get("content-type")
+        # content_length = int(response.headers.get("content-length", 0))
 
-    if pager:
-        """
-        A pager helps with responses that return the data in pages.
-        """
-        data_path, pager_fn = pager
-        data = []
-        while True:
-            current_page_data = response.json()
-            data.extend(current_page_data[data_path])
-            next_url = pager_fn(url, current_page_data)
-            if not next_url:
-                break
-            else:
-                response = requests.get(next_url, headers=headers, **kwargs)
-
-        content = json.dumps({data_path: data}).encode("utf-8")
-    else:
-        content = response.content
+        if pager:
+            chunks = _iter_paged_content(
+                url, response, pager, rate_limiter, retry_policy, headers, http_kwargs
+            )
+        else:
+            chunks = response.iter_content(chunk_size=CHUNK_SIZE)
 
-    if not tag:
-        tag = sha1(content).hexdigest()
+        # Write the content to a spooled file while computing the hash, so large files
+        # never have to be in memory completely.
+        stream = spooled_temporary_file()
+        hash_ = sha1()
+        # if not content_length: - Don't use http header as it might be wrong
+        # for example in case of compressed data
+        content_length = 0
+        for chunk in chunks:
+            stream.write(chunk)
+            hash_.update(chunk)
+            content_length += len(chunk)
+        stream.seek(0)
+    finally:
+        response.close()
 
-    # if not content_length: - Don't use http header as it might be wrong
-    # for example in case of compressed data
-    content_length = len(content)
+    if not tag:
+        tag = hash_.hexdigest()
 
     if current_file and current_file.tag == tag:
         # Not changed. Don't keep it
+        stream.close()
         return None
 
     return DraftFile(
@@ -94,7 +313,37 @@ def retrieve_http(
         modified_at=modified_at,
         tag=tag,
         size=content_length,
-        content_type=response.headers.get("content-type"),
-        stream=BytesIO(content),
+        content_type=content_type,
+        stream=stream,
         **file_attributes,
     )
+
+
+async def retrieve_http_async(
+    url,
+    current_file: Optional[File] = None,
+    headers: Optional[dict] = None,
+    pager: Optional[
+        Union[Pager, Tuple[str, Callable[[str, dict], Optional[str]]]]
+    ] = None,
+    last_modified: Optional[datetime] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+    **kwargs,
+) -> Optional[DraftFile]:
+    """
+    Async variant of `retrieve_http`. The request is executed by the default executor
+    of the running loop, so many files can be downloaded concurrently while sharing the
+    pooled connections of `get_http_session`.
+    """
+    return await asyncio.to_thread(
+        retrieve_http,
+        url,
+        current_file=current_file,
+        headers=headers,
+        pager=pager,
+        last_modified=last_modified,
+        rate_limiter=rate_limiter,
+        retry_policy=retry_policy,
+        **kwargs,
+    )
@@ -0,0 +1,30 @@
+import multiprocessing
+from contextlib import contextmanager
+from typing import List
+
+from ingestify.domain.models.rate_limiter import RateLimiter
+
+
+@contextmanager
+def shared_rate_limiters(rate_limiters: List[RateLimiter]):
+    """
+    Keep the state of `rate_limiters` in a `multiprocessing.Manager` while the block
+    runs, so their limits hold for all worker processes together. Enter this before
+    the limiters are pickled for the workers.
+
+    Afterwards, the limiters continue with a local copy of their state.
+    """
+    if not rate_limiters:
+        yield
+        return
+
+    with multiprocessing.Manager() as manager:
+        for rate_limiter in rate_limiters:
+            rate_limiter.use_state(
+                manager.dict(rate_limiter.state), manager.Condition()
+            )
+        try:
+            yield
+        finally:
+            for rate_limiter in rate_limiters:
+                rate_limiter.use_state(rate_limiter.state)
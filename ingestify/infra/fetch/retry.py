@@ -0,0 +1,130 @@
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Dict, FrozenSet, Optional
+
+import requests
+
+from ingestify.exceptions import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RetryPolicy:
+    """
+    When and how long to wait before a failed request is retried.
+
+    The backoff is exponential with "full jitter": a random wait between zero and
+    `backoff_factor * 2 ** attempt`, capped at `max_backoff`. When the server sends
+    a Retry-After header that value is used instead.
+    """
+
+    max_attempts: int = 5
+    backoff_factor: float = 0.5
+    max_backoff: float = 60.0
+    retry_statuses: FrozenSet[int] = field(
+        default_factory=lambda: frozenset({429, 500, 502, 503, 504})
+    )
+
+    # Stop sending requests to a host after this many consecutive failures, and
+    # try again after `circuit_breaker_timeout` seconds
+    circuit_breaker_threshold: int = 10
+    circuit_breaker_timeout: float = 30.0
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        return cls(
+            max_attempts=int(os.environ.get("INGESTIFY_HTTP_MAX_ATTEMPTS", "5")),
+            backoff_factor=float(
+                os.environ.get("INGESTIFY_HTTP_BACKOFF_FACTOR", "0.5")
+            ),
+            max_backoff=float(os.environ.get("INGESTIFY_HTTP_MAX_BACKOFF", "60")),
+        )
+
+    def get_retry_after(self, response: requests.Response) -> Optional[float]:
+        retry_after = response.headers.get("retry-after")
+        if not retry_after:
+            return None
+
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+
+        try:
+            return parsedate_to_datetime(retry_after).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+
+    def get_backoff(
+        self, attempt: int, response: Optional[requests.Response] = None
+    ) -> float:
+        if response is not None:
+            retry_after = self.get_retry_after(response)
+            if retry_after is not None:
+                return min(max(retry_after, 0.0), self.max_backoff)
+
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff_factor * 2**attempt)
+        )
+
+
+class CircuitBreaker:
+    """Keep track of consecutive failures of a single host."""
+
+    def __init__(self, host: str, threshold: int, timeout: float):
+        self.host = host
+        self.threshold = threshold
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._failure_count = 0
+        self._opened_at: Optional[float] = None
+
+    def check(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+
+            if time.time() - self._opened_at < self.timeout:
+                raise CircuitOpenError(
+                    f"Too many failed requests to {self.host}. Not sending requests "
+                    f"for {self.timeout} seconds"
+                )
+
+            # Half open: let requests through again. A single failure opens the
+            # circuit again.
+            self._opened_at = None
+            self._failure_count = self.threshold - 1
+
+    def record_success(self):
+        with self._lock:
+            self._failure_count = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failure_count += 1
+            if self._failure_count >= self.threshold and self._opened_at is None:
+                logger.warning(f"Opening circuit breaker for {self.host}")
+                self._opened_at = time.time()
+
+
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(host: str, retry_policy: RetryPolicy) -> CircuitBreaker:
+    with _circuit_breakers_lock:
+        if host not in _circuit_breakers:
+            _circuit_breakers[host] = CircuitBreaker(
+                host,
+                threshold=retry_policy.circuit_breaker_threshold,
+                timeout=retry_policy.circuit_breaker_timeout,
+            )
+        return _circuit_breakers[host]
@@ -1,9 +1,8 @@
 import json
 from datetime import datetime
 
-import requests
-
 from ingestify import Source, retrieve_http
+from ingestify.infra.fetch.http import http_get
 from ingestify.domain import DraftFile
 from ingestify.domain.models.dataset.dataset import DatasetState
 
@@ -16,7 +15,9 @@ class StatsbombGithub(Source):
     def discover_selectors(self, dataset_type: str, data_spec_versions: None = None):
         assert dataset_type == "match"
 
-        competitions = requests.get(f"{BASE_URL}/competitions.json").json()
+        competitions = http_get(
+            f"{BASE_URL}/competitions.json", self.rate_limiter
+        ).json()
         return [
             dict(
                 competition_id=competition["competition_id"],
@@ -36,8 +37,8 @@ class StatsbombGithub(Source):
 
         datasets = []
 
-        matches = requests.get(
-            f"{BASE_URL}/matches/{competition_id}/{season_id}.json"
+        matches = http_get(
+            f"{BASE_URL}/matches/{competition_id}/{season_id}.json", self.rate_limiter
         ).json()
 
         for match in matches:
@@ -76,6 +77,7 @@ class StatsbombGithub(Source):
             files[file_id] = retrieve_http(
                 url,
                 current_files.get(filename),
+                rate_limiter=self.rate_limiter,
                 file_data_feed_key=data_feed_key,
                 file_data_spec_version="v1",
                 file_data_serialization_format="json",
@@ -1,4 +1,5 @@
 import json
+import os
 from typing import Optional, Dict, List
 
 import requests
@@ -6,6 +7,8 @@ import requests
 from ingestify import Source, retrieve_http
 from ingestify.domain import DraftFile
 from ingestify.exceptions import ConfigurationError
+from ingestify.infra.fetch.http import http_get, Pager
+from ingestify.utils import map_ordered
 
 BASE_URL = "https://apirest.wyscout.com/v3"
 
@@ -17,6 +20,14 @@ def wyscout_pager_fn(url, response):
         return None
 
 
+def wyscout_pager(data_path: str) -> Pager:
+    return Pager(
+        data_path=data_path,
+        page_count=lambda response: response["meta"]["page_count"],
+        page_url=lambda url, page: f"{url}&page={page}",
+    )
+
+
 class Wyscout(Source):
     def discover_selectors(self, dataset_type: str) -> List[Dict]:
         raise NotImplementedError("Not implemented for Wyscout")
@@ -40,8 +51,9 @@ class Wyscout(Source):
             )
 
     def _get(self, path: str):
-        response = requests.get(
+        response = http_get(
             BASE_URL + path,
+            self.rate_limiter,
             auth=(self.username, self.password),
         )
         if response.status_code == 400:
@@ -56,15 +68,17 @@ class Wyscout(Source):
         return response.json()
 
     def _get_paged(self, path: str, data_path: str):
-        data = []
-        current_page = 1
-        page_count = None
-        while page_count is None or current_page <= page_count:
-            page_data = self._get(path + f"?page={current_page}&limit=100")
-            page_count = page_data["meta"]["page_count"]
-
+        first_page_data = self._get(path + "?page=1&limit=100")
+        page_count = first_page_data["meta"]["page_count"]
+
+        data = list(first_page_data[data_path])
+        # The page count is known now, so get the other pages concurrently
+        for page_data in map_ordered(
+            self._get,
+            [path + f"?page={page}&limit=100" for page in range(2, page_count + 1)],
+            max_workers=int(os.environ.get("INGESTIFY_PAGE_CONCURRENCY", "8")),
+        ):
             data.extend(page_data[data_path])
-            current_page += 1
 
         return data
 
@@ -90,7 +104,10 @@ class Wyscout(Source):
             ),
         ]:
             files[filename] = retrieve_http(
-                url, current_files.get(filename), auth=(self.username, self.password)
+                url,
+                current_files.get(filename),
+                rate_limiter=self.rate_limiter,
+                http_auth=(self.username, self.password),
             )
         return files
 
@@ -145,7 +162,7 @@ class Wyscout(Source):
 #             "players.json": retrieve_http(
 #                 f"{BASE_URL}/seasons/{identifier.season_id}/players?limit=100",
 #                 current_files.get("players.json"),
-#                 pager=("players", wyscout_pager_fn),
+#                 pager=wyscout_pager("players"),
 #                 auth=(self.username, self.password),
 #             )
 #         }
@@ -13,6 +13,7 @@ from sqlalchemy import (
     String,
     Table,
     TypeDecorator,
+    event,
 )
 from sqlalchemy.orm import registry, relationship
 
@@ -43,6 +44,7 @@ class TZDateTime(TypeDecorator):
 
 class PathString(TypeDecorator):
     impl = String(255)
+    cache_ok = True
 
     def process_bind_param(self, value: Path, dialect):
         return str(value)
@@ -81,6 +83,9 @@ dataset_table = Table(
     Column("state", DatasetStateString),
     Column("name", String(255)),
     Column("identifier", JSON),
+    # The `Identifier.key` of the identifier. Makes it possible to find datasets by
+    # their identifier using the index, instead of extracting values from the json.
+    Column("identifier_key", String(255), index=True),
     Column("metadata", JSON),
     Column("created_at", TZDateTime(6)),
     Column("updated_at", TZDateTime(6)),
@@ -112,7 +117,8 @@ file_table = Table(
     Column("data_serialization_format", String(255)),
     Column("storage_compression_method", String(255)),
     Column("storage_size", BigInteger),
-    Column("storage_path", PathString),
+    # Indexed to count the files that use a (content-addressed) blob
+    Column("storage_path", PathString, index=True),
     ForeignKeyConstraint(
         ("dataset_id", "revision_id"),
         [revision_table.c.dataset_id, revision_table.c.revision_id],
@@ -120,6 +126,20 @@ file_table = Table(
     ),
 )
 
+# The most recent version of every file of a dataset. It's maintained by the
+# repository when a dataset is saved, so the current state can be read without
+# squashing all revisions.
+current_file_table = Table(
+    "current_file",
+    metadata,
+    Column("dataset_id", String(255), primary_key=True),
+    Column("file_id", String(255), primary_key=True),
+    Column("revision_id", Integer),
+    Column("tag", String(255)),
+    Column("modified_at", TZDateTime(6)),
+    Column("storage_path", PathString),
+)
+
 
 mapper_registry.map_imperatively(
     Dataset,
@@ -129,7 +149,7 @@ mapper_registry.map_imperatively(
             Revision,
             backref="dataset",
             order_by=revision_table.c.revision_id,
-            lazy="joined",
+            lazy="selectin",
             cascade="all, delete-orphan",
         ),
     },
@@ -143,7 +163,7 @@ mapper_registry.map_imperatively(
             File,
             order_by=file_table.c.file_id,
             primaryjoin="and_(Revision.revision_id==File.revision_id, Revision.dataset_id==File.dataset_id)",
-            lazy="joined",
+            lazy="selectin",
             cascade="all, delete-orphan",
         )
     },
@@ -151,3 +171,9 @@ mapper_registry.map_imperatively(
 
 
 mapper_registry.map_imperatively(File, file_table)
+
+
+@event.listens_for(Dataset, "before_insert")
+@event.listens_for(Dataset, "before_update")
+def set_identifier_key(mapper, connection, target: Dataset):
+    target.identifier_key = target.identifier.key
@@ -0,0 +1,100 @@
+import logging
+
+from sqlalchemy import Engine, and_, bindparam, exists, func, inspect, select, update
+
+from .mapping import current_file_table, dataset_table, file_table
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 10_000
+
+
+def add_identifier_key(engine: Engine):
+    """Add the `identifier_key` column to a database created by an older version."""
+    columns = {column["name"] for column in inspect(engine).get_columns("dataset")}
+    if "identifier_key" in columns:
+        return
+
+    logger.info("Adding the identifier_key column to the dataset table")
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "ALTER TABLE dataset ADD COLUMN identifier_key VARCHAR(255)"
+        )
+
+        rows = connection.execute(
+            select(dataset_table.c.dataset_id, dataset_table.c.identifier)
+        ).all()
+        statement = (
+            update(dataset_table)
+            .where(dataset_table.c.dataset_id == bindparam("_dataset_id"))
+            .values(identifier_key=bindparam("_identifier_key"))
+        )
+        for i in range(0, len(rows), BATCH_SIZE):
+            connection.execute(
+                statement,
+                [
+                    # The identifier is deserialized as Identifier
+                    {"_dataset_id": dataset_id, "_identifier_key": identifier.key}
+                    for dataset_id, identifier in rows[i : i + BATCH_SIZE]
+                ],
+            )
+
+    for index in dataset_table.indexes:
+        if index.columns.keys() == ["identifier_key"]:
+            index.create(engine, checkfirst=True)
+
+
+def fill_current_file(engine: Engine):
+    """Fill the `current_file` table of a database created by an older version."""
+    with engine.connect() as connection:
+        is_empty = not connection.execute(select(exists(current_file_table))).scalar()
+        has_files = connection.execute(select(exists(file_table))).scalar()
+    if not is_empty or not has_files:
+        return
+
+    logger.info("Filling the current_file table")
+    last_revision = (
+        select(
+            file_table.c.dataset_id,
+            file_table.c.file_id,
+            func.max(file_table.c.revision_id).label("revision_id"),
+        )
+        .group_by(file_table.c.dataset_id, file_table.c.file_id)
+        .subquery()
+    )
+    columns = [
+        "dataset_id",
+        "file_id",
+        "revision_id",
+        "tag",
+        "modified_at",
+        "storage_path",
+    ]
+    with engine.begin() as connection:
+        connection.execute(
+            current_file_table.insert().from_select(
+                columns,
+                select(*[file_table.c[column] for column in columns]).join(
+                    last_revision,
+                    and_(
+                        file_table.c.dataset_id == last_revision.c.dataset_id,
+                        file_table.c.file_id == last_revision.c.file_id,
+                        file_table.c.revision_id == last_revision.c.revision_id,
+                    ),
+                ),
+            )
+        )
+
+
+def add_storage_path_index(engine: Engine):
+    """Add the index on `file.storage_path` to a database created by an older version."""
+    for index in file_table.indexes:
+        if index.columns.keys() == ["storage_path"]:
+            index.create(engine, checkfirst=True)
+
+
+def upgrade(engine: Engine):
+    """Bring the schema of an existing database up to date."""
+    add_identifier_key(engine)
+    fill_current_file(engine)
+    add_storage_path_index(engine)
@@ -1,11 +1,27 @@
 import json
+import os
 import uuid
-from typing import Optional, Union, List
-
-from sqlalchemy import create_engine, func, text, tuple_
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple, Union, List
+
+from sqlalchemy import (
+    Column,
+    MetaData,
+    String,
+    Table,
+    and_,
+    create_engine,
+    event,
+    func,
+    select,
+    text,
+    tuple_,
+)
 from sqlalchemy.engine import make_url
-from sqlalchemy.exc import NoSuchModuleError
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.exc import NoSuchModuleError, SQLAlchemyError
+from sqlalchemy.orm import Session, lazyload, selectinload, sessionmaker
+from sqlalchemy.orm.attributes import set_committed_value
 
 from ingestify.domain import File
 from ingestify.domain.models import (
@@ -13,13 +29,24 @@ from ingestify.domain.models import (
     DatasetCollection,
     DatasetRepository,
     Identifier,
+    Revision,
     Selector,
 )
 from ingestify.domain.models.dataset.collection_metadata import (
     DatasetCollectionMetadata,
 )
+from ingestify.exceptions import IngestifyError
+
+from .mapping import (
+    current_file_table,
+    dataset_table,
+    metadata,
+    revision_table,
+)
+from .migrations import upgrade
 
-from .mapping import dataset_table, metadata
+# Keep the number of parameters of a query below the limit of the database
+MAX_QUERY_PARAMETERS = 900
 
 
 def parse_value(v):
@@ -66,6 +93,20 @@ def isint(x):
         return a == b
 
 
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Use the write-ahead log, so readers don't block the writer (and the other way
+    around). Wait for a lock instead of failing with 'database is locked' right away.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(
+        f"PRAGMA busy_timeout={int(os.environ.get('INGESTIFY_SQLITE_BUSY_TIMEOUT', '30000'))}"
+    )
+    cursor.close()
+
+
 class SqlAlchemyDatasetRepository(DatasetRepository):
     @staticmethod
     def fix_url(url: str) -> str:
@@ -84,6 +125,26 @@ class SqlAlchemyDatasetRepository(DatasetRepository):
             return False
         return True
 
+    @staticmethod
+    def get_engine_options(engine_options: Optional[dict] = None) -> dict:
+        """
+        Return the options for the connection pool. Options that are not passed are
+        read from `INGESTIFY_DB_POOL_SIZE`, `INGESTIFY_DB_MAX_OVERFLOW`,
+        `INGESTIFY_DB_POOL_PRE_PING` and `INGESTIFY_DB_POOL_RECYCLE` (seconds).
+        Unset options use the defaults of SQLAlchemy.
+        """
+        engine_options = dict(engine_options or {})
+        for key, env_name, type_ in [
+            ("pool_size", "INGESTIFY_DB_POOL_SIZE", int),
+            ("max_overflow", "INGESTIFY_DB_MAX_OVERFLOW", int),
+            ("pool_pre_ping", "INGESTIFY_DB_POOL_PRE_PING", lambda v: v == "true"),
+            ("pool_recycle", "INGESTIFY_DB_POOL_RECYCLE", int),
+        ]:
+            value = os.environ.get(env_name)
+            if key not in engine_options and value is not None:
+                engine_options[key] = type_(value)
+        return engine_options
+
     def _init_engine(self):
         self.engine = create_engine(
             self.url,
@@ -91,24 +152,81 @@ class SqlAlchemyDatasetRepository(DatasetRepository):
             # isolation_level="SERIALIZABLE",
             json_serializer=json_serializer,
             json_deserializer=json_deserializer,
+            **self.get_engine_options(self.engine_options),
         )
-        self.session = Session(bind=self.engine)
+        # Every unit of work gets its own Session, and a connection from the pool for
+        # as long as it runs. Objects stay usable after the Session is closed.
+        self.session_factory = sessionmaker(bind=self.engine, expire_on_commit=False)
 
-    def __init__(self, url: str):
+        if self.engine.dialect.name == "sqlite":
+            # SQLite allows a single writer at a time
+            self.prefers_single_writer = True
+            event.listen(self.engine, "connect", set_sqlite_pragmas)
+
+    def __init__(self, url: str, engine_options: Optional[dict] = None):
         url = self.fix_url(url)
 
         self.url = url
+        self.engine_options = engine_options
         self._init_engine()
 
         metadata.create_all(self.engine)
+        upgrade(self.engine)
 
     def __getstate__(self):
-        return {"url": self.url}
+        return {"url": self.url, "engine_options": self.engine_options}
 
     def __setstate__(self, state):
         self.url = state["url"]
+        self.engine_options = state.get("engine_options")
         self._init_engine()
 
+    @contextmanager
+    def read_session(self) -> Iterator[Session]:
+        """A Session to read with. It's never committed."""
+        with self.session_factory() as session:
+            yield session
+
+    @contextmanager
+    def write_session(self) -> Iterator[Session]:
+        """A Session that's committed when the block succeeds, or rolled back."""
+        with self.session_factory.begin() as session:
+            yield session
+
+    def _filter_by_attributes(self, query, selectors: List[Selector]):
+        dialect = self.engine.dialect.name
+
+        keys = list(selectors[0].filtered_attributes.keys())
+
+        columns = []
+        first_selector = selectors[0].filtered_attributes
+
+        # Create a query like this:
+        #  SELECT * FROM dataset WHERE (column1, column2, column3) IN ((1, 2, 3), (4, 5, 6), (7, 8, 9))
+        for k in keys:
+            if dialect == "postgresql":
+                column = dataset_table.c.identifier[k]
+
+                # Take the value from the first selector to determine the type.
+                # TODO: check all selectors to determine the type
+                v = first_selector[k]
+                if isint(v):
+                    column = column.as_integer()
+                elif isfloat(v):
+                    column = column.as_float()
+                else:
+                    column = column.as_string()
+            else:
+                column = func.json_extract(Dataset.identifier, f"$.{k}")
+            columns.append(column)
+
+        values = []
+        for selector in selectors:
+            filtered_attributes = selector.filtered_attributes
+            values.append(tuple([filtered_attributes[k] for k in keys]))
+
+        return query.filter(tuple_(*columns).in_(values))
+
     def _filter_query(
         self,
         query,
@@ -117,6 +235,7 @@ class SqlAlchemyDatasetRepository(DatasetRepository):
         provider: Optional[str] = None,
         dataset_id: Optional[Union[str, List[str]]] = None,
         selector: Optional[Union[Selector, List[Selector]]] = None,
+        identifier_keys_table: Optional[Table] = None,
     ):
         query = query.filter(Dataset.bucket == bucket)
         if dataset_type:
@@ -134,7 +253,13 @@ class SqlAlchemyDatasetRepository(DatasetRepository):
             else:
                 query = query.filter(Dataset.dataset_id == dataset_id)
 
-        dialect = self.session.bind.dialect.name
+        if identifier_keys_table is not None:
+            # The identifiers are loaded in a temporary table
+            return query.filter(
+                dataset_table.c.identifier_key.in_(
+                    select(identifier_keys_table.c.identifier_key)
+                )
+            )
 
         if not isinstance(selector, list):
             where, selector = selector.split("where")
@@ -150,36 +275,15 @@ class SqlAlchemyDatasetRepository(DatasetRepository):
             if not selectors:
                 raise ValueError("Selectors must contain at least one item")
 
-            keys = list(selectors[0].filtered_attributes.keys())
-
-            columns = []
-            first_selector = selectors[0].filtered_attributes
-
-            # Create a query like this:
-            #  SELECT * FROM dataset WHERE (column1, column2, column3) IN ((1, 2, 3), (4, 5, 6), (7, 8, 9))
-            for k in keys:
-                if dialect == "postgresql":
-                    column = dataset_table.c.identifier[k]
-
-                    # Take the value from the first selector to determine the type.
-                    # TODO: check all selectors to determine the type
-                    v = first_selector[k]
-                    if isint(v):
-                        column = column.as_integer()
-                    elif isfloat(v):
-                        column = column.as_float()
-                    else:
-                        column = column.as_string()
-                else:
-                    column = func.json_extract(Dataset.identifier, f"$.{k}")
-                columns.append(column)
-
-            values = []
-            for selector in selectors:
-                filtered_attributes = selector.filtered_attributes
-                values.append(tuple([filtered_attributes[k] for k in keys]))
-
-            query = query.filter(tuple_(*columns).in_(values))
+            if all(isinstance(selector, Identifier) for selector in selectors):
+                # Complete identifiers can be found using the index on identifier_key
+                query = query.filter(
+                    dataset_table.c.identifier_key.in_(
+                        [selector.key for selector in selectors]
+                    )
+                )
+            else:
+                query = self._filter_by_attributes(query, selectors)
 
         if where:
             query = query.filter(text(where))
@@ -193,6 +297,113 @@ class SqlAlchemyDatasetRepository(DatasetRepository):
         dataset_id: Optional[Union[str, List[str]]] = None,
         selector: Optional[Union[Selector, List[Selector]]] = None,
         metadata_only: bool = False,
+        select: str = "full",
+    ) -> DatasetCollection:
+        if select not in ("full", "summary"):
+            raise ValueError(f"Unknown select '{select}'. Use 'full' or 'summary'")
+
+        kwargs = dict(
+            bucket=bucket,
+            dataset_type=dataset_type,
+            provider=provider,
+            dataset_id=dataset_id,
+            metadata_only=metadata_only,
+            select=select,
+        )
+        with self.read_session() as session:
+            return self._get_dataset_collection_in_chunks(
+                session, selector=selector, **kwargs
+            )
+
+    def _get_dataset_collection_in_chunks(
+        self, session: Session, selector, **kwargs
+    ) -> DatasetCollection:
+        if not isinstance(selector, list):
+            return self._get_dataset_collection(session, selector=selector, **kwargs)
+
+        # Remove duplicates, so chunks never match the same dataset. Selectors are
+        # compared by key, they don't have to be hashable.
+        selectors_by_key = {}
+        for selector_ in selector:
+            selectors_by_key.setdefault(selector_.key, selector_)
+        selectors = list(selectors_by_key.values())
+        is_identifiers = all(isinstance(selector, Identifier) for selector in selectors)
+        if is_identifiers:
+            # Identifiers are matched on identifier_key
+            parameters_per_selector = 1
+        else:
+            parameters_per_selector = max(1, len(selectors[0].filtered_attributes))
+        chunk_size = max(1, MAX_QUERY_PARAMETERS // parameters_per_selector)
+        if len(selectors) <= chunk_size:
+            return self._get_dataset_collection(session, selector=selectors, **kwargs)
+
+        if self.engine.dialect.name == "postgresql" and is_identifiers:
+            # Join with a temporary table, instead of sending a huge IN clause
+            identifier_keys_table = self._create_identifier_keys_table(
+                session, [selector.key for selector in selectors]
+            )
+            return self._get_dataset_collection(
+                session, identifier_keys_table=identifier_keys_table, **kwargs
+            )
+
+        # Query the selectors in chunks, so the number of parameters in a query stays
+        # below the limit of the database (for example 999 for older SQLite versions)
+        datasets = []
+        first_modified, last_modified, row_count = None, None, 0
+        for i in range(0, len(selectors), chunk_size):
+            dataset_collection = self._get_dataset_collection(
+                session, selector=selectors[i : i + chunk_size], **kwargs
+            )
+            datasets.extend(dataset_collection)
+
+            metadata_ = dataset_collection.metadata
+            if metadata_.first_modified is not None:
+                first_modified = min(
+                    filter(None, [first_modified, metadata_.first_modified])
+                )
+                last_modified = max(
+                    filter(None, [last_modified, metadata_.last_modified])
+                )
+            row_count += metadata_.row_count
+
+        return DatasetCollection(
+            DatasetCollectionMetadata(first_modified, last_modified, row_count),
+            datasets,
+        )
+
+    def _create_identifier_keys_table(
+        self, session: Session, identifier_keys: List[str]
+    ) -> Table:
+        """
+        Load the identifier keys in a temporary table. The table is dropped at the end
+        of the transaction, when the read session is closed.
+        """
+        identifier_keys_table = Table(
+            "tmp_identifier_key",
+            MetaData(),
+            Column("identifier_key", String(255), primary_key=True),
+            prefixes=["TEMPORARY"],
+            postgresql_on_commit="DROP",
+        )
+        connection = session.connection()
+        identifier_keys_table.create(connection)
+        connection.execute(
+            identifier_keys_table.insert(),
+            [{"identifier_key": identifier_key} for identifier_key in identifier_keys],
+        )
+        return identifier_keys_table
+
+    def _get_dataset_collection(
+        self,
+        session: Session,
+        bucket: str,
+        dataset_type: Optional[str] = None,
+        provider: Optional[str] = None,
+        dataset_id: Optional[Union[str, List[str]]] = None,
+        selector: Optional[Union[Selector, List[Selector]]] = None,
+        metadata_only: bool = False,
+        select: str = "full",
+        identifier_keys_table: Optional[Table] = None,
     ) -> DatasetCollection:
         def apply_query_filter(query):
             return self._filter_query(
@@ -202,18 +413,38 @@ class SqlAlchemyDatasetRepository(DatasetRepository):
                 provider=provider,
                 dataset_id=dataset_id,
                 selector=selector,
+                identifier_keys_table=identifier_keys_table,
             )
 
-        if not metadata_only:
+        if metadata_only:
+            datasets = []
+        elif select == "summary":
+            datasets = list(
+                apply_query_filter(
+                    session.query(Dataset).options(lazyload(Dataset.revisions))
+                )
+            )
+            if datasets:
+                self._load_current_revisions(session, datasets, apply_query_filter)
+        else:
+            # Load the revisions and files using separate queries, instead of joining
+            # them, which returns every dataset row once per file.
             dataset_query = apply_query_filter(
-                self.session.query(Dataset).options(joinedload(Dataset.revisions))
+                session.query(Dataset).options(
+                    selectinload(Dataset.revisions).selectinload(
+                        Revision.modified_files
+                    )
+                )
             )
             datasets = list(dataset_query)
-        else:
-            datasets = []
+
+        # Detach the datasets from the Session of this thread, so they can be
+        # saved from any other thread (or process).
+        for dataset in datasets:
+            session.expunge(dataset)
 
         metadata_result_row = apply_query_filter(
-            self.session.query(
+            session.query(
                 func.min(File.modified_at).label("first_modified_at"),
                 func.max(File.modified_at).label("last_modified_at"),
                 func.count().label("row_count"),
@@ -223,15 +454,160 @@ class SqlAlchemyDatasetRepository(DatasetRepository):
 
         return DatasetCollection(dataset_collection_metadata, datasets)
 
+    def _load_current_revisions(
+        self, session: Session, datasets: List[Dataset], apply_query_filter
+    ):
+        """
+        Give every dataset a single squashed revision, containing the most recent
+        version of every file as registered in the current_file table.
+        """
+        dataset_ids = apply_query_filter(session.query(Dataset.dataset_id)).statement
+
+        last_revision = (
+            select(
+                revision_table.c.dataset_id,
+                func.max(revision_table.c.revision_id).label("revision_id"),
+            )
+            .where(revision_table.c.dataset_id.in_(dataset_ids))
+            .group_by(revision_table.c.dataset_id)
+            .subquery()
+        )
+        last_revisions = {
+            row.dataset_id: row
+            for row in session.execute(
+                select(
+                    revision_table.c.dataset_id,
+                    revision_table.c.revision_id,
+                    revision_table.c.created_at,
+                ).join(
+                    last_revision,
+                    and_(
+                        revision_table.c.dataset_id == last_revision.c.dataset_id,
+                        revision_table.c.revision_id == last_revision.c.revision_id,
+                    ),
+                )
+            )
+        }
+
+        files_per_dataset: Dict[str, List[File]] = {}
+        for file in (
+            session.query(File)
+            .join(
+                current_file_table,
+                and_(
+                    File.dataset_id == current_file_table.c.dataset_id,
+                    File.file_id == current_file_table.c.file_id,
+                    File.revision_id == current_file_table.c.revision_id,
+                ),
+            )
+            .filter(current_file_table.c.dataset_id.in_(dataset_ids))
+        ):
+            session.expunge(file)
+            files_per_dataset.setdefault(file.dataset_id, []).append(file)
+
+        for dataset in datasets:
+            revisions = []
+            if last_revision_row := last_revisions.get(dataset.dataset_id):
+                revisions.append(
+                    Revision(
+                        revision_id=last_revision_row.revision_id,
+                        created_at=last_revision_row.created_at,
+                        description="Squashed revision",
+                        is_squashed=True,
+                        modified_files=sorted(
+                            files_per_dataset.get(dataset.dataset_id, []),
+                            key=lambda file: file.file_id,
+                        ),
+                    )
+                )
+            # Not a change that must be saved
+            set_committed_value(dataset, "revisions", revisions)
+
+    def _update_current_files(self, session: Session, datasets: List[Dataset]):
+        connection = session.connection()
+        dataset_ids = [dataset.dataset_id for dataset in datasets]
+        for i in range(0, len(dataset_ids), MAX_QUERY_PARAMETERS):
+            connection.execute(
+                current_file_table.delete().where(
+                    current_file_table.c.dataset_id.in_(
+                        dataset_ids[i : i + MAX_QUERY_PARAMETERS]
+                    )
+                )
+            )
+
+        rows = []
+        for dataset in datasets:
+            if current_revision := dataset.current_revision:
+                rows.extend(
+                    dict(
+                        dataset_id=dataset.dataset_id,
+                        file_id=file.file_id,
+                        revision_id=current_revision.get_file_revision_id(file.file_id),
+                        tag=file.tag,
+                        modified_at=file.modified_at,
+                        storage_path=file.storage_path,
+                    )
+                    for file in current_revision.modified_files
+                )
+        if rows:
+            connection.execute(current_file_table.insert(), rows)
+
     def save(self, bucket: str, dataset: Dataset):
-        # Just make sure
-        dataset.bucket = bucket
-        self.session.add(dataset)
-        self.session.commit()
+        for _, exception in self.save_many(bucket=bucket, datasets=[dataset]):
+            raise exception
+
+    def save_many(
+        self, bucket: str, datasets: List[Dataset]
+    ) -> List[Tuple[Dataset, Exception]]:
+        for dataset in datasets:
+            if dataset.is_summary:
+                raise IngestifyError(
+                    f"Cannot save a summary of dataset {dataset.dataset_id}"
+                )
+            # Just make sure
+            dataset.bucket = bucket
+
+        failed = []
+        saved = []
+        with self.write_session() as session:
+            for dataset in datasets:
+                # A SAVEPOINT per dataset. A failure only rolls back (and expires) the
+                # objects of that dataset, the others are committed as they are.
+                try:
+                    with session.begin_nested():
+                        session.add(dataset)
+                        # Flush, so a failure happens inside the SAVEPOINT
+                        session.flush()
+                except SQLAlchemyError as e:
+                    failed.append((dataset, e))
+                else:
+                    saved.append(dataset)
+            self._update_current_files(session, saved)
+        return failed
 
     def destroy(self, dataset: Dataset):
-        self.session.delete(dataset)
-        self.session.commit()
+        with self.write_session() as session:
+            session.execute(
+                current_file_table.delete().where(
+                    current_file_table.c.dataset_id == dataset.dataset_id
+                )
+            )
+            session.delete(dataset)
+
+    def get_storage_path_reference_counts(
+        self, storage_paths: List[Path]
+    ) -> Dict[Path, int]:
+        if not storage_paths:
+            return {}
+
+        with self.read_session() as session:
+            rows = (
+                session.query(File.storage_path, func.count())
+                .filter(File.storage_path.in_(storage_paths))
+                .group_by(File.storage_path)
+                .all()
+            )
+        return {storage_path: count for storage_path, count in rows}
 
     def next_identity(self):
         return str(uuid.uuid4())
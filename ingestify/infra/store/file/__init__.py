@@ -1,2 +1,3 @@
 from .local_file_repository import LocalFileRepository
 from .s3_file_repository import S3FileRepository
+from .cached_file_repository import CachedFileRepository
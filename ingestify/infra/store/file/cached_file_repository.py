@@ -0,0 +1,207 @@
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from hashlib import sha1
+from pathlib import Path
+from typing import BinaryIO, List, Optional, Tuple
+
+from ingestify.domain.models import Dataset, File, FileRepository
+
+logger = logging.getLogger(__name__)
+
+
+class CachedFileRepository(FileRepository):
+    """
+    Read-through cache on local disk for any FileRepository.
+
+    Files loaded via `load_file_content(s)` are kept in `cache_dir`, keyed by storage
+    path and tag, so a file that's stored again under the same path is never served from a
+    stale copy. When the cache grows beyond `max_size` bytes, the least recently used
+    files are removed.
+
+    The size of the cache is tracked by each process. Files added by other processes
+    are counted once they're used by this process, or at the next start.
+    """
+
+    def __init__(self, file_repository: FileRepository, cache_dir: str, max_size: int):
+        self.file_repository = file_repository
+        self.base_dir = file_repository.base_dir
+        self.cache_dir = Path(cache_dir)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        # Cached files (path -> size) from least to most recently used. The cache
+        # directory is scanned once, after that the size is tracked per file.
+        self._entries: Optional[OrderedDict] = None
+        self._size = 0
+
+    @classmethod
+    def supports(cls, url: str) -> bool:
+        # Never build by url. It wraps another FileRepository.
+        return False
+
+    @classmethod
+    def wrap(
+        cls, file_repository: FileRepository, file_cache: Optional[dict] = None
+    ) -> FileRepository:
+        """
+        Wrap `file_repository` when a cache directory is configured, using the
+        `file_cache` config (`directory` and `max_size`) or the
+        `INGESTIFY_FILE_CACHE_DIR` and `INGESTIFY_FILE_CACHE_MAX_SIZE` environment
+        variables. The default max size is 10GB.
+        """
+        file_cache = file_cache or {}
+        cache_dir = file_cache.get("directory") or os.environ.get(
+            "INGESTIFY_FILE_CACHE_DIR"
+        )
+        if not cache_dir:
+            return file_repository
+
+        max_size = file_cache.get("max_size") or int(
+            os.environ.get("INGESTIFY_FILE_CACHE_MAX_SIZE", str(10 * 1024**3))
+        )
+        return cls(file_repository, cache_dir=cache_dir, max_size=int(max_size))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        # Every process scans the cache directory itself
+        state["_entries"] = None
+        state["_size"] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _get_cache_path(self, storage_path: Path, tag: str) -> Path:
+        key = sha1(f"{storage_path}\0{tag}".encode("utf-8")).hexdigest()
+        return self.cache_dir / key[:2] / key
+
+    def _load_cached(self, file: File) -> Optional[BinaryIO]:
+        cache_path = self._get_cache_path(file.storage_path, file.tag)
+        try:
+            fh = open(cache_path, "rb")
+        except FileNotFoundError:
+            return None
+
+        try:
+            # Mark as recently used, for the next scan of the cache directory
+            os.utime(cache_path)
+        except FileNotFoundError:
+            # Evicted by another process. The open handle can still be read.
+            pass
+        self._add(cache_path, os.fstat(fh.fileno()).st_size)
+        return fh
+
+    def _store(self, file: File, source: BinaryIO) -> BinaryIO:
+        cache_path = self._get_cache_path(file.storage_path, file.tag)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(
+            f"{cache_path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        with source, open(tmp_path, "wb") as fp:
+            shutil.copyfileobj(source, fp)
+
+        # Open the file before it's moved into the cache. The handle stays valid when
+        # the file is evicted.
+        fh = open(tmp_path, "rb")
+        os.replace(tmp_path, cache_path)
+        self._add(cache_path, os.fstat(fh.fileno()).st_size)
+        return fh
+
+    def load_file_content(self, file: File) -> BinaryIO:
+        fh = self._load_cached(file)
+        if fh is None:
+            fh = self._store(file, self.file_repository.load_file_content(file))
+        return fh
+
+    def load_files_content(self, files: List[File]) -> List[BinaryIO]:
+        contents = [self._load_cached(file) for file in files]
+        missing = [idx for idx, fh in enumerate(contents) if fh is None]
+        if missing:
+            # Load the files that are not cached at once, so the repository can load
+            # them in parallel
+            sources = self.file_repository.load_files_content(
+                [files[idx] for idx in missing]
+            )
+            for idx, source in zip(missing, sources):
+                contents[idx] = self._store(files[idx], source)
+        return contents
+
+    def _get_entries(self) -> OrderedDict:
+        if self._entries is None:
+            entries = []
+            for path in self.cache_dir.glob("*/*"):
+                if path.suffix == ".tmp":
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+
+            self._entries = OrderedDict(
+                (path, size) for _, path, size in sorted(entries)
+            )
+            self._size = sum(self._entries.values())
+        return self._entries
+
+    def _add(self, cache_path: Path, size: int):
+        """Mark `cache_path` as most recently used, and evict when the cache is full."""
+        with self._lock:
+            entries = self._get_entries()
+            self._size += size - entries.pop(cache_path, 0)
+            entries[cache_path] = size
+
+            # Never evict the file that was just used, even when it's bigger than
+            # max_size
+            evicted = 0
+            while self._size > self.max_size and len(entries) > 1:
+                path, entry_size = entries.popitem(last=False)
+                path.unlink(missing_ok=True)
+                self._size -= entry_size
+                evicted += 1
+
+            if evicted:
+                logger.debug(
+                    f"Evicted {evicted} files from cache. Cache size is now {self._size}"
+                )
+
+    def save_content(
+        self,
+        bucket: str,
+        dataset: Dataset,
+        revision_id: int,
+        filename: str,
+        stream: BinaryIO,
+    ) -> Path:
+        return self.file_repository.save_content(
+            bucket, dataset, revision_id, filename, stream
+        )
+
+    def load_content(
+        self, bucket: str, dataset: Dataset, revision_id: int, filename: str
+    ) -> BinaryIO:
+        return self.file_repository.load_content(bucket, dataset, revision_id, filename)
+
+    def save_content_by_path(self, path: Path, stream: BinaryIO) -> Path:
+        return self.file_repository.save_content_by_path(path, stream)
+
+    def save_contents_by_path(self, items: List[Tuple[Path, BinaryIO]]) -> List[Path]:
+        return self.file_repository.save_contents_by_path(items)
+
+    def load_content_by_path(self, path: Path) -> BinaryIO:
+        return self.file_repository.load_content_by_path(path)
+
+    def content_exists(self, path: Path) -> bool:
+        return self.file_repository.content_exists(path)
+
+    def delete_content(self, path: Path):
+        self.file_repository.delete_content(path)
+
+    def get_path(
+        self, bucket: str, dataset: Dataset, revision_id: int, filename: str
+    ) -> Path:
+        return self.file_repository.get_path(bucket, dataset, revision_id, filename)
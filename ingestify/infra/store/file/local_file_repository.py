@@ -1,5 +1,6 @@
 import os
 import shutil
+import uuid
 from pathlib import Path
 from typing import IO, AnyStr, BinaryIO
 
@@ -20,13 +21,30 @@ class LocalFileRepository(FileRepository):
         stream: BinaryIO,
     ) -> Path:
         path = self.get_path(bucket, dataset, revision_id, filename)
+        return self.save_content_by_path(path, stream)
+
+    def load_content(
+        self, bucket: str, dataset: Dataset, revision_id: int, filename: str
+    ) -> BinaryIO:
+        return self.load_content_by_path(
+            self.get_path(bucket, dataset, revision_id, filename)
+        )
+
+    def save_content_by_path(self, path: Path, stream: BinaryIO) -> Path:
         path.parent.mkdir(parents=True, exist_ok=True)
 
-        with open(path, "wb") as fp:
+        # Write to a temporary file first, so a file at `path` is always complete
+        tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as fp:
             shutil.copyfileobj(stream, fp)
+        os.replace(tmp_path, path)
         return path
 
-    def load_content(
-        self, bucket: str, dataset: Dataset, revision_id: int, filename: str
-    ) -> BinaryIO:
-        return open(self.get_path(bucket, dataset, revision_id, filename), "rb")
+    def load_content_by_path(self, path: Path) -> BinaryIO:
+        return open(path, "rb")
+
+    def content_exists(self, path: Path) -> bool:
+        return path.exists()
+
+    def delete_content(self, path: Path):
+        path.unlink(missing_ok=True)
@@ -1,26 +1,79 @@
+import os
+import threading
 from pathlib import Path
-from typing import BinaryIO
+from typing import BinaryIO, List, Tuple
 
 import boto3 as boto3
+import botocore.exceptions
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 
 from ingestify.domain import Dataset
-from ingestify.domain.models import FileRepository
+from ingestify.domain.models import File, FileRepository
+from ingestify.utils import map_ordered, spooled_temporary_file
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    """
+    Return the S3 client shared by all threads within this process. Clients (unlike
+    resources) are thread-safe. The connection pool is sized using
+    `INGESTIFY_S3_MAX_POOL_CONNECTIONS` (default 32).
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = boto3.session.Session().client(
+                    "s3",
+                    config=Config(
+                        max_pool_connections=int(
+                            os.environ.get("INGESTIFY_S3_MAX_POOL_CONNECTIONS", "32")
+                        )
+                    ),
+                )
+                _client_pid = pid
+    return _client
+
+
+def get_transfer_config() -> TransferConfig:
+    """
+    Files larger than `INGESTIFY_S3_MULTIPART_THRESHOLD` bytes (default 8MB) are
+    transferred in parts of `INGESTIFY_S3_MULTIPART_CHUNKSIZE` bytes (default 8MB),
+    using up to `INGESTIFY_S3_MAX_CONCURRENCY` threads per file (default 10).
+    """
+    return TransferConfig(
+        multipart_threshold=int(
+            os.environ.get("INGESTIFY_S3_MULTIPART_THRESHOLD", str(8 * 1024 * 1024))
+        ),
+        multipart_chunksize=int(
+            os.environ.get("INGESTIFY_S3_MULTIPART_CHUNKSIZE", str(8 * 1024 * 1024))
+        ),
+        max_concurrency=int(os.environ.get("INGESTIFY_S3_MAX_CONCURRENCY", "10")),
+    )
 
 
 class S3FileRepository(FileRepository):
     def __init__(self, url):
         super().__init__(url)
 
-        self._s3 = None
+        self.transfer_config = get_transfer_config()
 
     @property
     def s3(self):
-        if not self._s3:
-            self._s3 = boto3.resource("s3")
-        return self._s3
+        return get_s3_client()
 
     def __getstate__(self):
-        return {"base_dir": self.base_dir, "_s3": None}
+        return {"base_dir": self.base_dir}
+
+    def __setstate__(self, state):
+        self.base_dir = state["base_dir"]
+        self.transfer_config = get_transfer_config()
 
     def save_content(
         self,
@@ -31,19 +84,62 @@ class S3FileRepository(FileRepository):
         stream: BinaryIO,
     ) -> Path:
         key = self.get_path(bucket, dataset, revision_id, filename)
-        s3_bucket = Path(key.parts[0])
-
-        self.s3.Object(str(s3_bucket), str(key.relative_to(s3_bucket))).put(Body=stream)
-        return key
+        return self.save_content_by_path(key, stream)
 
     def load_content(
         self, bucket: str, dataset: Dataset, revision_id: int, filename: str
     ) -> BinaryIO:
         key = self.get_path(bucket, dataset, revision_id, filename)
-        s3_bucket = Path(key.parts[0])
-        return self.s3.Object(str(s3_bucket), str(key.relative_to(s3_bucket))).get()[
-            "Body"
-        ]
+        return self.load_content_by_path(key)
+
+    @staticmethod
+    def _split_path(path: Path) -> Tuple[str, str]:
+        s3_bucket = Path(path.parts[0])
+        return str(s3_bucket), str(path.relative_to(s3_bucket))
+
+    def save_content_by_path(self, path: Path, stream: BinaryIO) -> Path:
+        s3_bucket, key = self._split_path(path)
+        self.s3.upload_fileobj(stream, s3_bucket, key, Config=self.transfer_config)
+        return path
+
+    def load_content_by_path(self, path: Path) -> BinaryIO:
+        s3_bucket, key = self._split_path(path)
+        stream = spooled_temporary_file()
+        self.s3.download_fileobj(s3_bucket, key, stream, Config=self.transfer_config)
+        stream.seek(0)
+        return stream
+
+    def save_contents_by_path(self, items: List[Tuple[Path, BinaryIO]]) -> List[Path]:
+        return list(
+            map_ordered(
+                lambda item: self.save_content_by_path(*item),
+                items,
+                max_workers=min(len(items), self.transfer_config.max_concurrency),
+            )
+        )
+
+    def load_files_content(self, files: List[File]) -> List[BinaryIO]:
+        return list(
+            map_ordered(
+                self.load_file_content,
+                files,
+                max_workers=min(len(files), self.transfer_config.max_concurrency),
+            )
+        )
+
+    def content_exists(self, path: Path) -> bool:
+        s3_bucket, key = self._split_path(path)
+        try:
+            self.s3.head_object(Bucket=s3_bucket, Key=key)
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return False
+            raise
+        return True
+
+    def delete_content(self, path: Path):
+        s3_bucket, key = self._split_path(path)
+        self.s3.delete_object(Bucket=s3_bucket, Key=key)
 
     @classmethod
     def supports(cls, url: str) -> bool:
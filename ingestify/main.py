@@ -3,7 +3,7 @@ import logging
 import os
 import sys
 from itertools import product
-from typing import Optional, Type
+from typing import Optional, Type, Union
 
 from pyaml_env import parse_config
 
@@ -23,7 +23,9 @@ from ingestify.domain.models.event import EventBus, Publisher, Subscriber
 
 from ingestify.domain.models.extract_job import ExtractJob
 from ingestify.domain.models.fetch_policy import FetchPolicy
+from ingestify.domain.models.rate_limiter import RateLimiter
 from ingestify.exceptions import ConfigurationError
+from ingestify.infra.store.file import CachedFileRepository
 
 logger = logging.getLogger(__name__)
 
@@ -60,15 +62,24 @@ def import_cls(name):
 
 
 def get_dataset_store_by_urls(
-    dataset_url: str, file_url: str, bucket: str
+    dataset_url: str,
+    file_url: str,
+    bucket: str,
+    storage_compression: Optional[Union[str, dict]] = None,
+    file_layout: str = "hierarchical",
+    file_cache: Optional[dict] = None,
+    engine_options: Optional[dict] = None,
 ) -> DatasetStore:
     """
-    Initialize a DatasetStore by a DatasetRepository and a FileRepository
+    Initialize a DatasetStore by a DatasetRepository and a FileRepository.
+
+    `engine_options` (like `pool_size`) are passed to the DatasetRepository.
     """
     if not bucket:
         raise Exception("Bucket is not specified")
 
     file_repository = file_repository_factory.build_if_supports(url=file_url)
+    file_repository = CachedFileRepository.wrap(file_repository, file_cache)
 
     if secrets_manager.supports(dataset_url):
         dataset_url = secrets_manager.load_as_db_url(dataset_url)
@@ -76,21 +87,57 @@ def get_dataset_store_by_urls(
     if dataset_url.startswith("postgres://"):
         dataset_url = dataset_url.replace("postgress://", "postgress+")
 
-    dataset_repository = dataset_repository_factory.build_if_supports(url=dataset_url)
+    if engine_options:
+        cls_name = dataset_repository_factory.registry.get_supporting_component(
+            url=dataset_url
+        )
+        dataset_repository = dataset_repository_factory.build(
+            cls_name, url=dataset_url, engine_options=engine_options
+        )
+    else:
+        dataset_repository = dataset_repository_factory.build_if_supports(
+            url=dataset_url
+        )
     return DatasetStore(
         dataset_repository=dataset_repository,
         file_repository=file_repository,
         bucket=bucket,
+        storage_compression=storage_compression,
+        file_layout=file_layout,
     )
 
 
+def get_storage_compression(main_config: dict, bucket: str):
+    """
+    Return the `storage_compression` spec for a bucket. A spec for a specific bucket
+    can be set using `buckets`:
+
+        storage_compression:
+          default: gzip
+          buckets:
+            tracking: zstd
+    """
+    storage_compression = main_config.get("storage_compression")
+    if isinstance(storage_compression, dict) and "buckets" in storage_compression:
+        storage_compression = dict(storage_compression)
+        buckets = storage_compression.pop("buckets")
+        if bucket in buckets:
+            return buckets[bucket]
+    return storage_compression
+
+
 def get_datastore(config_file, bucket: Optional[str] = None) -> DatasetStore:
     config = parse_config(config_file, default_value="")
 
+    bucket = bucket or config["main"].get("default_bucket")
     return get_dataset_store_by_urls(
         dataset_url=config["main"]["dataset_url"],
         file_url=config["main"]["file_url"],
-        bucket=bucket or config["main"].get("default_bucket"),
+        bucket=bucket,
+        storage_compression=get_storage_compression(config["main"], bucket),
+        file_layout=config["main"].get("file_layout", "hierarchical"),
+        file_cache=config["main"].get("file_cache"),
+        engine_options=config["main"].get("engine_options"),
     )
 
 
@@ -137,7 +184,10 @@ def build_source(name, source_args):
     else:
         configuration = raw_configuration
 
-    return source_cls(name=name, **configuration)
+    source = source_cls(name=name, **configuration)
+    if rate_limit := source_args.get("rate_limit"):
+        source.rate_limiter = RateLimiter(**rate_limit)
+    return source
 
 
 def get_event_subscriber_cls(key: str) -> Type[Subscriber]:
@@ -154,10 +204,15 @@ def get_engine(config_file, bucket: Optional[str] = None) -> IngestionEngine:
         sources[name] = build_source(name=name, source_args=source_args)
 
     logger.info("Initializing IngestionEngine")
+    bucket = bucket or config["main"].get("default_bucket")
     store = get_dataset_store_by_urls(
         dataset_url=config["main"]["dataset_url"],
         file_url=config["main"]["file_url"],
-        bucket=bucket or config["main"].get("default_bucket"),
+        bucket=bucket,
+        storage_compression=get_storage_compression(config["main"], bucket),
+        file_layout=config["main"].get("file_layout", "hierarchical"),
+        file_cache=config["main"].get("file_cache"),
+        engine_options=config["main"].get("engine_options"),
     )
 
     # Setup an EventBus and wire some more components
@@ -0,0 +1,61 @@
+from datetime import timedelta
+from pathlib import Path
+
+from ingestify.domain import Dataset, File, Identifier, Revision
+from ingestify.domain.models.dataset.dataset import DatasetState
+from ingestify.utils import utcnow
+
+
+def build_file(file_id: str, tag: str) -> File:
+    return File(
+        file_id=file_id,
+        created_at=utcnow(),
+        modified_at=utcnow(),
+        tag=tag,
+        size=2,
+        content_type="application/json",
+        data_feed_key=file_id,
+        data_spec_version="v1",
+        data_serialization_format="json",
+        storage_size=2,
+        storage_compression_method="none",
+        storage_path=Path(f"{file_id}.json"),
+    )
+
+
+def test_current_revision():
+    now = utcnow()
+    dataset = Dataset(
+        bucket="main",
+        dataset_id="1",
+        name="Match 1",
+        state=DatasetState.COMPLETE,
+        dataset_type="match",
+        provider="fake",
+        identifier=Identifier(match_id=1),
+        metadata={},
+        created_at=now,
+        updated_at=now,
+    )
+    events = build_file("events", "a")
+    lineups = build_file("lineups", "a")
+    dataset.add_revision(Revision(0, now, "Create", [events, lineups]))
+    dataset.add_revision(
+        Revision(1, now + timedelta(seconds=1), "Update", [build_file("events", "b")])
+    )
+
+    current_revision = dataset.current_revision
+    assert current_revision.is_squashed
+    assert dataset.current_revision is current_revision
+    assert current_revision.modified_files_map["events"].tag == "b"
+    assert current_revision.get_file_revision_id("events") == 1
+    assert current_revision.get_file_revision_id("lineups") == 0
+    # Reading the current revision doesn't change the files of the revisions
+    assert current_revision.modified_files_map["lineups"] is lineups
+    assert lineups.revision_id is None
+
+    dataset.add_revision(
+        Revision(2, now + timedelta(seconds=2), "Update", [build_file("lineups", "b")])
+    )
+    assert dataset.current_revision is not current_revision
+    assert dataset.current_revision.modified_files_map["lineups"].tag == "b"
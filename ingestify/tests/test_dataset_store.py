@@ -0,0 +1,443 @@
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import inspect
+
+from ingestify.application.codecs import CodecSelector
+from ingestify.domain import DraftFile, Identifier
+from ingestify.domain.models.event import EventBus
+from ingestify.exceptions import IngestifyError
+from ingestify.main import get_dataset_store_by_urls
+
+
+@pytest.fixture
+def store(datastore_dir):
+    return get_dataset_store_by_urls(
+        dataset_url=f"sqlite:///{datastore_dir}/main.db",
+        file_url=f"file://{datastore_dir}/data",
+        bucket="main",
+    )
+
+
+def create_dataset(store, match_id=1, **files):
+    store.create_dataset(
+        dataset_type="match",
+        provider="fake",
+        dataset_identifier=Identifier(match_id=match_id),
+        files={
+            file_id: DraftFile.from_input(
+                content, data_feed_key=file_id, data_serialization_format="json"
+            )
+            for file_id, content in files.items()
+        },
+    )
+    datasets = store.get_dataset_collection(match_id=match_id)
+    # Nothing is returned while the write is pending
+    return datasets.first() if len(datasets) else None
+
+
+@pytest.mark.parametrize("method", ["none", "gzip", "zstd", "lz4"])
+def test_storage_codecs(store, method):
+    if method == "zstd":
+        pytest.importorskip("zstandard")
+    elif method == "lz4":
+        pytest.importorskip("lz4")
+
+    store.codec_selector = CodecSelector(
+        {"default": "gzip", "formats": {"json": method}}
+    )
+    dataset = create_dataset(store, events='{"events": []}')
+
+    file = dataset.current_revision.modified_files[0]
+    assert file.storage_compression_method == method
+
+    files = store.load_files(dataset)
+    assert files.get_file("events").stream.read() == b'{"events": []}'
+
+
+def test_read_files_after_changing_codec(store):
+    dataset = create_dataset(store, events='{"events": []}')
+    assert (
+        dataset.current_revision.modified_files[0].storage_compression_method == "gzip"
+    )
+
+    store.codec_selector = CodecSelector("none")
+    store.add_revision(
+        dataset,
+        {"lineups": DraftFile.from_input("[]", data_feed_key="lineups")},
+    )
+
+    dataset = store.get_dataset_collection().first()
+    files = store.load_files(dataset)
+    assert files.get_file("events").stream.read() == b'{"events": []}'
+    assert files.get_file("lineups").stream.read() == b"[]"
+
+
+@pytest.mark.parametrize("method", ["none", "gzip"])
+def test_load_files_streaming(store, method):
+    store.codec_selector = CodecSelector(method)
+    content = b'{"events": [' + b", ".join([b"1"] * 100_000) + b"]}"
+    dataset = create_dataset(store, events=content.decode("utf-8"))
+
+    files = store.load_files(dataset, streaming=True)
+    stream = files.get_file("events").stream
+    assert stream.read(12) == b'{"events": [' and stream.tell() == 12
+
+    # Seeking backward opens the file again
+    stream.seek(2)
+    assert stream.read(6) == b"events"
+
+    # get_file rewinds the stream
+    assert files.get_file("events").stream.read() == content
+
+
+def test_content_addressed_layout(datastore_dir):
+    store = get_dataset_store_by_urls(
+        dataset_url=f"sqlite:///{datastore_dir}/main.db",
+        file_url=f"file://{datastore_dir}/data",
+        bucket="main",
+        file_layout="content_addressed",
+    )
+    dataset1 = create_dataset(store, match_id=1, events="[1, 2, 3]")
+    dataset2 = create_dataset(store, match_id=2, events="[1, 2, 3]")
+
+    storage_path = dataset1.current_revision.modified_files[0].storage_path
+    assert dataset2.current_revision.modified_files[0].storage_path == storage_path
+    assert storage_path.parts[:2] == ("main", "blobs")
+    assert store.load_files(dataset2).get_file("events").stream.read() == b"[1, 2, 3]"
+
+    # The blob is still used by dataset2
+    store.destroy_dataset(dataset1)
+    blob_path = store.file_repository.get_absolute_path(storage_path)
+    assert blob_path.exists()
+
+    store.destroy_dataset(dataset2)
+    assert not blob_path.exists()
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_load_files_many(store, ordered):
+    for match_id in range(10):
+        create_dataset(store, match_id=match_id, events=f"[{match_id}]")
+
+    dataset_collection = store.get_dataset_collection()
+    results = list(
+        store.load_files_many(dataset_collection, max_workers=3, ordered=ordered)
+    )
+    assert len(results) == 10
+    if ordered:
+        assert [dataset for dataset, _ in results] == list(dataset_collection)
+
+    for dataset, files in results:
+        content = files.get_file("events").stream.read()
+        assert content == f"[{dataset.identifier.match_id}]".encode("utf-8")
+
+
+def test_identifier_key_migration(store, datastore_dir):
+    create_dataset(store, match_id=1, events="[]")
+
+    # Go back to the schema of before the identifier_key column
+    with store.dataset_repository.engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_dataset_identifier_key")
+        connection.exec_driver_sql("ALTER TABLE dataset DROP COLUMN identifier_key")
+
+    store = get_dataset_store_by_urls(
+        dataset_url=f"sqlite:///{datastore_dir}/main.db",
+        file_url=f"file://{datastore_dir}/data",
+        bucket="main",
+    )
+    dataset_collection = store.get_dataset_collection(
+        selector=[Identifier(match_id=1), Identifier(match_id=2)]
+    )
+    assert len(dataset_collection) == 1
+
+    with store.dataset_repository.engine.connect() as connection:
+        plan = connection.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT * FROM dataset WHERE identifier_key IN ('a', 'b')"
+        ).all()
+    assert "ix_dataset_identifier_key" in str(plan)
+
+
+def test_large_selector_list(store):
+    for match_id in range(10):
+        create_dataset(store, match_id=match_id, events="[]")
+    expected_metadata = store.get_dataset_collection().metadata
+
+    identifiers = [Identifier(match_id=match_id) for match_id in range(2000)]
+    # Duplicates must not be counted twice
+    dataset_collection = store.get_dataset_collection(selector=identifiers * 2)
+    assert len(dataset_collection) == 10
+    assert dataset_collection.metadata == expected_metadata
+
+    dataset_collection = store.get_dataset_collection(
+        selector=[{"match_id": match_id} for match_id in range(2000)]
+    )
+    assert len(dataset_collection) == 10
+    assert dataset_collection.metadata == expected_metadata
+
+
+@pytest.fixture
+def postgres_store(datastore_dir):
+    url = os.environ.get("INGESTIFY_TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("INGESTIFY_TEST_POSTGRES_URL is not set")
+
+    return get_dataset_store_by_urls(
+        dataset_url=url,
+        file_url=f"file://{datastore_dir}/data",
+        # The database is not cleaned up, so use a bucket of our own
+        bucket=f"test-{uuid.uuid4().hex}",
+    )
+
+
+def test_large_selector_list_postgres(postgres_store, monkeypatch):
+    store = postgres_store
+    repository = store.dataset_repository
+
+    tables = []
+    create_identifier_keys_table = repository._create_identifier_keys_table
+
+    def spy(session, identifier_keys):
+        tables.append(identifier_keys)
+        return create_identifier_keys_table(session, identifier_keys)
+
+    monkeypatch.setattr(repository, "_create_identifier_keys_table", spy)
+
+    for match_id in range(10):
+        create_dataset(store, match_id=match_id, events="[]")
+    expected_metadata = store.get_dataset_collection().metadata
+
+    identifiers = [Identifier(match_id=match_id) for match_id in range(2000)]
+    # The read session is never committed. The temporary table is dropped when the
+    # session is closed, otherwise the second query can't create it again.
+    for _ in range(2):
+        dataset_collection = store.get_dataset_collection(selector=identifiers * 2)
+        assert len(dataset_collection) == 10
+        assert dataset_collection.metadata == expected_metadata
+
+    # The identifiers are joined with the temporary table, without duplicates
+    assert len(tables) == 2
+    assert len(tables[0]) == 2000
+
+
+def test_summary(store):
+    dataset = create_dataset(store, events="[1]", lineups="[]")
+    store.add_revision(
+        dataset, {"events": DraftFile.from_input("[1, 2]", data_feed_key="events")}
+    )
+    create_dataset(store, match_id=2, events="[]")
+
+    summary = store.get_dataset_collection(match_id=1, select="summary").first()
+    assert summary.is_summary
+    assert len(summary.revisions) == 1
+
+    dataset = store.get_dataset_collection(match_id=1).first()
+    assert not dataset.is_summary
+    current_revision = dataset.current_revision
+    assert summary.current_revision.revision_id == current_revision.revision_id
+    assert summary.current_revision.created_at == current_revision.created_at
+    assert [
+        (file.file_id, file.revision_id, file.tag)
+        for file in summary.current_revision.modified_files
+    ] == [
+        (file.file_id, file.revision_id, file.tag)
+        for file in current_revision.modified_files
+    ]
+
+    with pytest.raises(IngestifyError):
+        store.add_revision(
+            summary, {"events": DraftFile.from_input("[]", data_feed_key="events")}
+        )
+
+
+def test_fill_current_file(store, datastore_dir):
+    dataset = create_dataset(store, events="[1]", lineups="[]")
+    store.add_revision(
+        dataset, {"events": DraftFile.from_input("[1, 2]", data_feed_key="events")}
+    )
+    expected = store.get_dataset_collection(select="summary").first()
+
+    # Go back to the time before the current_file table
+    with store.dataset_repository.engine.begin() as connection:
+        connection.exec_driver_sql("DELETE FROM current_file")
+
+    store = get_dataset_store_by_urls(
+        dataset_url=f"sqlite:///{datastore_dir}/main.db",
+        file_url=f"file://{datastore_dir}/data",
+        bucket="main",
+    )
+    summary = store.get_dataset_collection(select="summary").first()
+    assert summary.current_revision == expected.current_revision
+    assert store.load_files(summary).get_file("events").stream.read() == b"[1, 2]"
+
+
+def test_storage_path_index(store, datastore_dir):
+    # Go back to the time before the index
+    with store.dataset_repository.engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_file_storage_path")
+
+    store = get_dataset_store_by_urls(
+        dataset_url=f"sqlite:///{datastore_dir}/main.db",
+        file_url=f"file://{datastore_dir}/data",
+        bucket="main",
+    )
+    indexes = inspect(store.dataset_repository.engine).get_indexes("file")
+    assert [index["column_names"] for index in indexes] == [["storage_path"]]
+
+
+def test_write_batching(store):
+    events = []
+
+    class Recorder:
+        def dispatch(self, event):
+            events.append(event)
+
+    event_bus = EventBus()
+    event_bus.register(Recorder())
+    store.set_event_bus(event_bus)
+    store.write_batch_size = 3
+
+    create_dataset(store, match_id=1, events="[]")
+    create_dataset(store, match_id=2, events="[]")
+    # Nothing is saved, or dispatched, until the batch is full
+    assert len(store.get_dataset_collection()) == 0
+    assert events == []
+
+    create_dataset(store, match_id=3, events="[]")
+    assert len(store.get_dataset_collection()) == 3
+    assert [type(event).__name__ for event in events] == [
+        "RevisionAdded",
+        "DatasetCreated",
+    ] * 3
+
+    create_dataset(store, match_id=4, events="[]")
+    assert len(store.get_dataset_collection()) == 3
+    store.flush()
+    assert len(store.get_dataset_collection()) == 4
+    assert len(events) == 8
+
+
+@pytest.fixture
+def worker_store(datastore_dir):
+    """A store of a worker process, that leaves the writes to the single writer."""
+    worker_store = get_dataset_store_by_urls(
+        dataset_url=f"sqlite:///{datastore_dir}/main.db",
+        file_url=f"file://{datastore_dir}/data",
+        bucket="main",
+    )
+    worker_store.outbox = []
+    return worker_store
+
+
+def test_write_outbox(store, worker_store):
+    store.single_writer_batch_size = 2
+
+    # The single writer batches the datasets of the workers
+    create_dataset(worker_store, match_id=1, events="[]")
+    store.write_outbox(worker_store.take_outbox())
+    assert len(store.get_dataset_collection()) == 0
+
+    create_dataset(worker_store, match_id=2, events="[]")
+    store.write_outbox(worker_store.take_outbox())
+    assert len(store.get_dataset_collection()) == 2
+
+
+def test_write_outbox_failures(store, worker_store):
+    events = []
+
+    class FailingRecorder:
+        def dispatch(self, event):
+            if type(event).__name__ == "RevisionAdded":
+                raise Exception("Failed to handle")
+            events.append(event)
+
+    event_bus = EventBus()
+    event_bus.register(FailingRecorder())
+    store.set_event_bus(event_bus)
+    store.single_writer_batch_size = 2
+
+    create_dataset(worker_store, match_id=1, events="[]")
+    create_dataset(worker_store, match_id=2, events="[]")
+    store.write_outbox(worker_store.take_outbox())
+
+    # A failing event doesn't stop the rest of the outbox
+    assert len(store.get_dataset_collection()) == 2
+    assert [type(event).__name__ for event in events] == ["DatasetCreated"] * 2
+
+
+def test_write_max_latency(store):
+    store.write_batch_size = 3
+    store.write_max_latency = 0.1
+
+    create_dataset(store, match_id=1, events="[]")
+    assert len(store.get_dataset_collection()) == 0
+
+    # The timer writes the pending dataset, without another dataset being saved
+    time.sleep(0.5)
+    assert len(store.get_dataset_collection()) == 1
+
+
+def test_write_failure_drops_only_failed_dataset(store):
+    events = []
+
+    class Recorder:
+        def dispatch(self, event):
+            events.append(event)
+
+    event_bus = EventBus()
+    event_bus.register(Recorder())
+    store.set_event_bus(event_bus)
+
+    create_dataset(store, match_id=1, events="[]")
+    # Two workers update their own copy of the same dataset
+    dataset = store.get_dataset_collection(match_id=1).first()
+    conflicting_dataset = store.get_dataset_collection(match_id=1).first()
+    events.clear()
+
+    store.write_batch_size = 3
+    store.add_revision(
+        dataset, {"events": DraftFile.from_input("[1]", data_feed_key="events")}
+    )
+    # Gets the same revision_id, and can't be saved
+    store.add_revision(
+        conflicting_dataset,
+        {"events": DraftFile.from_input("[2]", data_feed_key="events")},
+    )
+    create_dataset(store, match_id=2, events="[]")
+
+    assert len(store.get_dataset_collection(match_id=1).first().revisions) == 2
+    assert len(store.get_dataset_collection(match_id=2)) == 1
+    assert [(type(event).__name__, event.dataset) for event in events] == [
+        ("RevisionAdded", dataset),
+        ("RevisionAdded", events[1].dataset),
+        ("DatasetCreated", events[1].dataset),
+    ]
+    assert all(event.dataset is not conflicting_dataset for event in events)
+
+
+def test_engine_options(datastore_dir, monkeypatch):
+    monkeypatch.setenv("INGESTIFY_DB_POOL_RECYCLE", "60")
+    store = get_dataset_store_by_urls(
+        dataset_url=f"sqlite:///{datastore_dir}/main.db",
+        file_url=f"file://{datastore_dir}/data",
+        bucket="main",
+        engine_options={"pool_size": 2, "max_overflow": 0, "pool_pre_ping": True},
+    )
+    engine = store.dataset_repository.engine
+    assert engine.pool.size() == 2
+    assert engine.pool._recycle == 60
+
+    # Every read and write gives its connection back to the pool, so many threads
+    # can share a small pool.
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(
+            executor.map(
+                lambda match_id: create_dataset(store, match_id=match_id, events="[]"),
+                range(16),
+            )
+        )
+    assert engine.pool.checkedout() == 0
+    assert len(store.get_dataset_collection()) == 16
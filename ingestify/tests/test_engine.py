@@ -212,3 +212,144 @@ def test_iterator_source(config_file):
     assert len(datasets) == 100
     for dataset in datasets:
         assert len(dataset.revisions) == 2
+
+
+def test_engine_async_executor(config_file, monkeypatch):
+    monkeypatch.setenv("INGESTIFY_EXECUTOR", "async")
+
+    engine = get_engine(config_file, "main")
+    for season_id in range(5):
+        add_extract_job(
+            engine,
+            SimpleFakeSource("fake-source"),
+            competition_id=1,
+            season_id=season_id,
+        )
+    engine.load()
+
+    datasets = engine.store.get_dataset_collection()
+    assert len(datasets) == 5
+    for dataset in datasets:
+        assert len(dataset.revisions) == 1
+
+
+def test_engine_thread_executor(config_file, monkeypatch):
+    monkeypatch.setenv("INGESTIFY_RUN_EAGER", "false")
+    # Discover multiple selectors at the same time, while tasks are running
+    monkeypatch.setenv("INGESTIFY_DISCOVERY_CONCURRENCY", "3")
+
+    engine = get_engine(config_file, "main")
+    for season_id in range(5):
+        add_extract_job(
+            engine,
+            SimpleFakeSource("fake-source"),
+            competition_id=1,
+            season_id=season_id,
+        )
+    engine.load(executor="threads")
+
+    datasets = engine.store.get_dataset_collection()
+    assert len(datasets) == 5
+
+    engine.load(executor="threads")
+
+    datasets = engine.store.get_dataset_collection()
+    for dataset in datasets:
+        assert len(dataset.revisions) == 2
+
+
+class SelectorDiscoveringSource(SimpleFakeSource):
+    def __init__(self, name):
+        super().__init__(name)
+        self.discover_selectors_count = 0
+
+    def discover_selectors(self, dataset_type: str):
+        self.discover_selectors_count += 1
+        return [
+            dict(competition_id=1, season_id=2),
+            dict(competition_id=1, season_id=3),
+        ]
+
+
+def test_discover_selectors_once_per_source(config_file, tmp_path, monkeypatch):
+    monkeypatch.setenv("INGESTIFY_SELECTOR_CACHE_DIR", str(tmp_path))
+
+    engine = get_engine(config_file, "main")
+    source = SelectorDiscoveringSource("fake-source")
+    data_spec_versions = DataSpecVersionCollection.from_dict({"default": {"v1"}})
+    for season_id in [2, 3]:
+        engine.add_extract_job(
+            ExtractJob(
+                source=source,
+                fetch_policy=FetchPolicy(),
+                selectors=[
+                    Selector.build(
+                        lambda selector, season_id_=season_id: selector["season_id"]
+                        == season_id_,
+                        data_spec_versions=data_spec_versions,
+                    )
+                ],
+                dataset_type="match",
+                data_spec_versions=data_spec_versions,
+            )
+        )
+    engine.load()
+
+    assert source.discover_selectors_count == 1
+    assert len(engine.store.get_dataset_collection()) == 2
+
+    # The second run uses the selectors cached on disk
+    engine.load()
+    assert source.discover_selectors_count == 1
+
+
+def test_engine_single_writer(config_file, monkeypatch):
+    monkeypatch.setenv("INGESTIFY_RUN_EAGER", "false")
+    monkeypatch.setenv("INGESTIFY_CONCURRENCY", "2")
+
+    engine = get_engine(config_file, "main")
+    # SQLite prefers a single writer: the workers send their writes to this process
+    assert engine.loader.use_single_writer()
+    for season_id in range(5):
+        add_extract_job(
+            engine,
+            SimpleFakeSource("fake-source"),
+            competition_id=1,
+            season_id=season_id,
+        )
+    engine.load(executor="processes")
+
+    datasets = engine.store.get_dataset_collection()
+    assert len(datasets) == 5
+
+    engine.load(executor="processes")
+
+    datasets = engine.store.get_dataset_collection()
+    for dataset in datasets:
+        assert len(dataset.revisions) == 2
+
+
+def test_engine_process_executor(config_file, monkeypatch):
+    monkeypatch.setenv("INGESTIFY_RUN_EAGER", "false")
+    monkeypatch.setenv("INGESTIFY_CONCURRENCY", "2")
+    # Every worker process writes to the database itself
+    monkeypatch.setenv("INGESTIFY_SINGLE_WRITER", "false")
+
+    engine = get_engine(config_file, "main")
+    for season_id in range(5):
+        add_extract_job(
+            engine,
+            SimpleFakeSource("fake-source"),
+            competition_id=1,
+            season_id=season_id,
+        )
+    engine.load(executor="processes")
+
+    datasets = engine.store.get_dataset_collection()
+    assert len(datasets) == 5
+
+    engine.load(executor="processes")
+
+    datasets = engine.store.get_dataset_collection()
+    for dataset in datasets:
+        assert len(dataset.revisions) == 2
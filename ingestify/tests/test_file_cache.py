@@ -0,0 +1,89 @@
+from pathlib import Path
+
+from ingestify.domain import DraftFile, File
+from ingestify.infra.store.file import CachedFileRepository, LocalFileRepository
+from ingestify.utils import utcnow
+
+
+def store_file(repository, name: str, content: bytes, tag: str) -> File:
+    path = repository.base_dir / "main" / name
+    repository.save_content_by_path(path, DraftFile.from_input(content).stream)
+    now = utcnow()
+    return File(
+        file_id=name,
+        created_at=now,
+        modified_at=now,
+        tag=tag,
+        size=len(content),
+        content_type=None,
+        data_feed_key=name,
+        data_spec_version="v1",
+        data_serialization_format="txt",
+        storage_size=len(content),
+        storage_compression_method="none",
+        storage_path=Path("main") / name,
+    )
+
+
+def test_file_cache(datastore_dir, monkeypatch):
+    repository = LocalFileRepository(f"file://{datastore_dir}/files")
+    cache = CachedFileRepository(
+        repository, cache_dir=f"{datastore_dir}/cache", max_size=250
+    )
+
+    loaded_files = []
+    load_file_content = repository.load_file_content
+
+    def counting_load_file_content(file):
+        loaded_files.append(file.file_id)
+        return load_file_content(file)
+
+    monkeypatch.setattr(repository, "load_file_content", counting_load_file_content)
+
+    file1 = store_file(repository, "file1", b"1" * 100, tag="a")
+    file2 = store_file(repository, "file2", b"2" * 100, tag="a")
+
+    for file in [file1, file2, file1]:
+        with cache.load_file_content(file) as fp:
+            assert fp.read() == file.storage_path.name[-1].encode() * 100
+    assert loaded_files == ["file1", "file2"]
+
+    # The file was stored again: a different tag must not be served from the cache
+    file1 = store_file(repository, "file1", b"3" * 100, tag="b")
+    with cache.load_file_content(file1) as fp:
+        assert fp.read() == b"3" * 100
+    assert loaded_files == ["file1", "file2", "file1"]
+
+    # The cache can hold only two files. The least recently used is evicted.
+    cached_files = list(Path(f"{datastore_dir}/cache").glob("*/*"))
+    assert len(cached_files) == 2
+
+
+def test_file_cache_load_many(datastore_dir, monkeypatch):
+    repository = LocalFileRepository(f"file://{datastore_dir}/files")
+    # Too small for any file: the file that's loaded is still returned
+    cache = CachedFileRepository(
+        repository, cache_dir=f"{datastore_dir}/cache", max_size=50
+    )
+
+    loaded_many = []
+    load_files_content = repository.load_files_content
+
+    def recording_load_files_content(files):
+        loaded_many.append([file.file_id for file in files])
+        return load_files_content(files)
+
+    monkeypatch.setattr(repository, "load_files_content", recording_load_files_content)
+
+    file1 = store_file(repository, "file1", b"1" * 100, tag="a")
+    file2 = store_file(repository, "file2", b"2" * 100, tag="a")
+
+    with cache.load_file_content(file1) as fp:
+        assert fp.read() == b"1" * 100
+
+    # Only the file that's not cached is loaded from the repository
+    contents = cache.load_files_content([file1, file2])
+    assert [fp.read() for fp in contents] == [b"1" * 100, b"2" * 100]
+    for fp in contents:
+        fp.close()
+    assert loaded_many == [["file2"]]
@@ -0,0 +1,170 @@
+import json
+import threading
+from hashlib import sha1
+from typing import List
+
+import pytest
+from requests import Response
+from requests.adapters import BaseAdapter
+
+from ingestify import retrieve_http
+from ingestify.exceptions import CircuitOpenError
+from ingestify.infra.fetch.http import get_http_session, http_get, Pager
+from ingestify.infra.fetch.retry import RetryPolicy
+
+
+class FakeAdapter(BaseAdapter):
+    """Return the given responses, one per request."""
+
+    def __init__(self, responses: List[tuple]):
+        super().__init__()
+        self.responses = responses
+        self.request_count = 0
+
+    def send(self, request, **kwargs):
+        status_code, headers, content = self.responses[self.request_count]
+        self.request_count += 1
+
+        response = Response()
+        response.status_code = status_code
+        response.headers.update(headers)
+        response._content = content
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class PagedAdapter(FakeAdapter):
+    """Return page `n` of `pages` for a request with `page=n`."""
+
+    def __init__(self, pages: List[list]):
+        super().__init__([])
+        self.pages = pages
+        self.lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        page = int(request.url.split("page=")[-1]) if "page=" in request.url else 1
+        with self.lock:
+            self.request_count += 1
+
+        response = Response()
+        response.status_code = 200
+        response._content = json.dumps(
+            {
+                "items": self.pages[page - 1],
+                "meta": {"page_current": page, "page_count": len(self.pages)},
+            }
+        ).encode("utf-8")
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        return response
+
+
+@pytest.fixture
+def fake_host(monkeypatch):
+    # Use a fresh session, so the fake adapters don't stick around
+    monkeypatch.setattr("ingestify.infra.fetch.http._session", None)
+
+    def mount(host, responses):
+        adapter = FakeAdapter(responses)
+        get_http_session().mount(f"https://{host}/", adapter)
+        return adapter
+
+    return mount
+
+
+retry_policy = RetryPolicy(
+    max_attempts=3, backoff_factor=0.001, circuit_breaker_threshold=3
+)
+
+
+def test_retrieve_http_retries(fake_host):
+    adapter = fake_host(
+        "retry.test",
+        [
+            (502, {}, b""),
+            (503, {"retry-after": "0"}, b""),
+            (200, {}, b'{"data": 1}'),
+        ],
+    )
+
+    file = retrieve_http(
+        "https://retry.test/data.json",
+        retry_policy=retry_policy,
+        file_data_feed_key="data",
+        file_data_spec_version="v1",
+        file_data_serialization_format="json",
+    )
+    assert adapter.request_count == 3
+    assert file.stream.read() == b'{"data": 1}'
+
+
+def test_circuit_breaker(fake_host):
+    fake_host("down.test", [(500, {}, b"")] * 3)
+
+    response = http_get("https://down.test/data.json", retry_policy=retry_policy)
+    assert response.status_code == 500
+
+    with pytest.raises(CircuitOpenError):
+        http_get("https://down.test/data.json", retry_policy=retry_policy)
+
+
+def test_retrieve_http_spools_large_files(fake_host, monkeypatch):
+    monkeypatch.setenv("INGESTIFY_SPOOL_MAX_SIZE", "1024")
+    content = b"x" * 10_000
+    fake_host("large.test", [(200, {}, content)])
+
+    file = retrieve_http(
+        "https://large.test/data.json",
+        file_data_feed_key="data",
+        file_data_spec_version="v1",
+        file_data_serialization_format="json",
+    )
+    assert file.size == len(content)
+    assert file.tag == sha1(content).hexdigest()
+    # Moved to disk as it's larger than INGESTIFY_SPOOL_MAX_SIZE
+    assert file.stream._rolled
+    assert file.stream.read() == content
+
+
+@pytest.mark.parametrize(
+    "pager",
+    [
+        Pager(
+            data_path="items",
+            page_count=lambda data: data["meta"]["page_count"],
+            page_url=lambda url, page: f"{url}?page={page}",
+            max_workers=4,
+        ),
+        (
+            "items",
+            lambda url, data: (
+                f"{url}?page={data['meta']['page_current'] + 1}"
+                if data["meta"]["page_current"] < data["meta"]["page_count"]
+                else None
+            ),
+        ),
+    ],
+)
+def test_retrieve_http_paged(fake_host, pager):
+    pages = [[{"id": page * 10 + i} for i in range(3)] for page in range(12)]
+    adapter = PagedAdapter(pages)
+    get_http_session().mount("https://paged.test/", adapter)
+
+    file = retrieve_http(
+        "https://paged.test/items",
+        pager=pager,
+        file_data_feed_key="items",
+        file_data_spec_version="v1",
+        file_data_serialization_format="json",
+    )
+    assert adapter.request_count == 12
+
+    expected = json.dumps({"items": [item for page in pages for item in page]})
+    assert file.stream.read() == expected.encode("utf-8")
+    assert file.tag == sha1(expected.encode("utf-8")).hexdigest()
@@ -0,0 +1,86 @@
+import threading
+import time
+from multiprocessing import get_context
+
+import cloudpickle
+
+from ingestify.domain.models.rate_limiter import RateLimiter
+from ingestify.infra.fetch.rate_limiter import shared_rate_limiters
+
+
+def _acquire_many(args):
+    rate_limiter_pickled, count = args
+    rate_limiter = cloudpickle.loads(rate_limiter_pickled)
+    for _ in range(count):
+        rate_limiter.acquire()
+        rate_limiter.release(status_code=200)
+
+
+def test_rate_limiter_requests_per_second():
+    rate_limiter = RateLimiter(requests_per_second=50, burst=1)
+
+    start = time.time()
+    for _ in range(11):
+        rate_limiter.acquire()
+        rate_limiter.release(status_code=200)
+
+    # The first request can use the burst
+    assert time.time() - start >= 10 / 50 * 0.9
+
+
+def test_rate_limiter_shared_between_processes():
+    rate_limiter = RateLimiter(requests_per_second=50, burst=1)
+
+    with shared_rate_limiters([rate_limiter]):
+        rate_limiter_pickled = cloudpickle.dumps(rate_limiter)
+
+        start = time.time()
+        with get_context("spawn").Pool(2) as pool:
+            pool.map(
+                _acquire_many,
+                [(rate_limiter_pickled, 10), (rate_limiter_pickled, 10)],
+            )
+
+        # When both processes had their own bucket this would take half the time
+        assert time.time() - start >= 19 / 50 * 0.9
+
+    # The limiter continues with a local copy of the shared state
+    assert rate_limiter.state["in_flight"] == 0
+    rate_limiter.acquire()
+    rate_limiter.release(status_code=200)
+
+
+def test_rate_limiter_adaptive():
+    rate_limiter = RateLimiter(max_concurrency=16, adaptive=True)
+    assert rate_limiter.concurrency == 4
+
+    for _ in range(40):
+        rate_limiter.acquire()
+        rate_limiter.release(status_code=200)
+    assert rate_limiter.concurrency > 8
+
+    rate_limiter.acquire()
+    rate_limiter.release(status_code=429)
+    assert rate_limiter.concurrency <= 8
+
+
+def test_rate_limiter_max_concurrency():
+    rate_limiter = RateLimiter(max_concurrency=1)
+    rate_limiter.acquire()
+
+    released_at = None
+
+    def release():
+        nonlocal released_at
+        time.sleep(0.1)
+        released_at = time.time()
+        rate_limiter.release(status_code=200)
+
+    thread = threading.Thread(target=release)
+    thread.start()
+
+    # Waits for the request in flight to finish
+    rate_limiter.acquire()
+    assert released_at is not None
+    rate_limiter.release(status_code=200)
+    thread.join()
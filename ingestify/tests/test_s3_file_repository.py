@@ -0,0 +1,63 @@
+import os
+from pathlib import Path
+
+import pytest
+
+moto = pytest.importorskip("moto")
+
+from ingestify.domain import DraftFile, Identifier
+from ingestify.main import get_dataset_store_by_urls
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    # Use multipart transfers for files larger than 5MB (the minimum part size)
+    monkeypatch.setenv("INGESTIFY_S3_MULTIPART_THRESHOLD", str(5 * 1024 * 1024))
+    monkeypatch.setenv("INGESTIFY_S3_MULTIPART_CHUNKSIZE", str(5 * 1024 * 1024))
+    # Don't reuse a client created outside of the mock
+    monkeypatch.setattr("ingestify.infra.store.file.s3_file_repository._client", None)
+
+    with moto.mock_aws():
+        from ingestify.infra.store.file.s3_file_repository import get_s3_client
+
+        get_s3_client().create_bucket(Bucket="test-bucket")
+        yield
+
+
+def test_s3_file_repository(s3, datastore_dir):
+    store = get_dataset_store_by_urls(
+        dataset_url=f"sqlite:///{datastore_dir}/main.db",
+        file_url="s3://test-bucket/ingestify",
+        bucket="main",
+        storage_compression="none",
+    )
+
+    large_content = os.urandom(12 * 1024 * 1024)
+    store.create_dataset(
+        dataset_type="match",
+        provider="fake",
+        dataset_identifier=Identifier(match_id=1),
+        files={
+            "tracking": DraftFile.from_input(large_content, data_feed_key="tracking"),
+            "events": DraftFile.from_input("[]", data_feed_key="events"),
+        },
+    )
+
+    dataset = store.get_dataset_collection().first()
+    files = store.load_files(dataset)
+    assert files.get_file("tracking").stream.read() == large_content
+    assert files.get_file("events").stream.read() == b"[]"
+
+    path = store.file_repository.get_absolute_path(
+        files.get_file("events").storage_path
+    )
+    assert path == Path(
+        "test-bucket/ingestify/main/provider=fake/dataset_type=match/match_id=1/0/events.txt"
+    )
+    assert store.file_repository.content_exists(path)
+
+    store.destroy_dataset(dataset)
+    assert not store.file_repository.content_exists(path)
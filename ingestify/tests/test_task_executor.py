@@ -0,0 +1,35 @@
+import threading
+import time
+
+from ingestify.utils import TaskExecutor
+
+
+def test_task_executor_backpressure(monkeypatch):
+    monkeypatch.setenv("INGESTIFY_RUN_EAGER", "false")
+
+    lock = threading.Lock()
+    submitted = 0
+    finished = 0
+    max_pending = 0
+
+    def tasks():
+        nonlocal submitted, max_pending
+        for i in range(50):
+            with lock:
+                submitted += 1
+                max_pending = max(max_pending, submitted - finished)
+            yield i
+
+    def run_task(i):
+        nonlocal finished
+        time.sleep(0.001)
+        with lock:
+            finished += 1
+
+    task_executor = TaskExecutor(processes=2, threads=True, max_in_flight=3)
+    task_executor.run(run_task, tasks())
+    task_executor.join()
+
+    assert finished == 50
+    # The item that is waiting to be submitted is counted as well
+    assert max_pending <= 4
@@ -1,17 +1,29 @@
 import abc
+import asyncio
 import inspect
+import logging
 import os
+import threading
 import time
 import re
+import tempfile
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
 from multiprocessing import get_context, cpu_count, get_all_start_methods
+from multiprocessing.pool import ThreadPool
 
 from datetime import datetime, timezone
 from string import Template
-from typing import Dict, Generic, Type, TypeVar, Tuple, Optional, Any
+from typing import Callable, Dict, Generic, Type, TypeVar, Tuple, Optional, Any
 
 import cloudpickle
 from typing_extensions import Self
 
+from ingestify.exceptions import ConfigurationError
+
+logger = logging.getLogger(__name__)
+
 
 def sanitize_exception_message(exception_message):
     """
@@ -111,6 +123,15 @@ def utcnow() -> datetime:
     return datetime.fromtimestamp(time.time(), timezone.utc)
 
 
+def spooled_temporary_file() -> tempfile.SpooledTemporaryFile:
+    """
+    Return a file that's kept in memory until it grows beyond `INGESTIFY_SPOOL_MAX_SIZE`
+    bytes (default 16MB). After that it's moved to disk.
+    """
+    max_size = int(os.environ.get("INGESTIFY_SPOOL_MAX_SIZE", str(16 * 1024 * 1024)))
+    return tempfile.SpooledTemporaryFile(max_size=max_size, mode="w+b")
+
+
 NOT_SET = object()
 
 
@@ -199,10 +220,29 @@ def map_in_pool(func, iterable, processes=0):
         )
 
 
+def cloud_unpack_all_and_call(args):
+    f_pickled, args_pickled = args
+
+    f = cloudpickle.loads(f_pickled)
+    return f(cloudpickle.loads(args_pickled))
+
+
+def cloud_unpack_and_initialize(initializer_pickled, initargs_pickled):
+    initializer = cloudpickle.loads(initializer_pickled)
+    return initializer(*cloudpickle.loads(initargs_pickled))
+
+
 class SyncPool:
     def map_async(self, func, iterable):
         return [func(item) for item in iterable]
 
+    def apply_async(self, func, args=(), callback=None, error_callback=None):
+        # Don't use the error_callback: when running eager we want exceptions to surface
+        result = func(*args)
+        if callback:
+            callback(result)
+        return result
+
     def join(self):
         return True
 
@@ -211,27 +251,253 @@ class SyncPool:
 
 
 class TaskExecutor:
-    def __init__(self, processes=0):
+    """
+    Run tasks in a pool of processes (default) or threads.
+
+    `run` applies backpressure: it blocks while `max_in_flight` tasks, or tasks worth
+    `max_in_flight_bytes` of pickled payload, are submitted but not finished yet. This
+    way discovery of new tasks can't run ahead of their execution.
+    """
+
+    is_async = False
+
+    def __init__(
+        self,
+        processes=0,
+        threads=False,
+        max_in_flight=0,
+        max_in_flight_bytes=0,
+        initializer=None,
+        initargs=(),
+    ):
+        if not processes:
+            processes = int(os.environ.get("INGESTIFY_CONCURRENCY", "0"))
+
+        if threads:
+            # Tasks are mostly waiting on I/O, so we can run many more threads than
+            # there are cores.
+            processes = processes or 64
+        else:
+            processes = processes or cpu_count()
+
+        # Eager mode and threads share the memory of this process: there is no need to
+        # pickle anything.
+        self.in_process = threads or os.environ.get("INGESTIFY_RUN_EAGER") == "true"
+
         if os.environ.get("INGESTIFY_RUN_EAGER") == "true":
             pool = SyncPool()
+        elif threads:
+            pool = ThreadPool(processes)
         else:
-            if not processes:
-                processes = int(os.environ.get("INGESTIFY_CONCURRENCY", "0"))
-
             if "fork" in get_all_start_methods():
                 ctx = get_context("fork")
             else:
                 ctx = get_context("spawn")
 
-            pool = ctx.Pool(processes or cpu_count())
+            if initializer:
+                # Only pickle the initializer when it's actually shipped to another process
+                initargs = (cloudpickle.dumps(initializer), cloudpickle.dumps(initargs))
+                initializer = cloud_unpack_and_initialize
+
+            pool = ctx.Pool(processes, initializer=initializer, initargs=initargs)
         self.pool = pool
 
-    def run(self, func, iterable):
-        wrapped_fn = cloudpickle.dumps(func)
-        self.pool.map_async(
-            cloud_unpack_and_call, ((wrapped_fn, item) for item in iterable)
-        )
+        if not max_in_flight:
+            max_in_flight = int(os.environ.get("INGESTIFY_MAX_IN_FLIGHT_TASKS", "0"))
+        if not max_in_flight_bytes:
+            max_in_flight_bytes = int(
+                os.environ.get("INGESTIFY_MAX_IN_FLIGHT_BYTES", "0")
+            )
+
+        self.max_in_flight = max_in_flight or processes * 4
+        self.max_in_flight_bytes = max_in_flight_bytes or 256 * 1024 * 1024
+
+        self._in_flight = 0
+        self._in_flight_bytes = 0
+        self._condition = threading.Condition()
+
+    def _acquire(self, size: int):
+        with self._condition:
+            # Always allow a single task, even when it's bigger than the limit
+            while self._in_flight > 0 and (
+                self._in_flight >= self.max_in_flight
+                or self._in_flight_bytes + size > self.max_in_flight_bytes
+            ):
+                self._condition.wait()
+
+            self._in_flight += 1
+            self._in_flight_bytes += size
+
+    def _release(self, size: int):
+        with self._condition:
+            self._in_flight -= 1
+            self._in_flight_bytes -= size
+            self._condition.notify_all()
+
+    def run(self, func, iterable, on_result: Optional[Callable] = None):
+        """
+        Run `func` for every item. `on_result` is called in this process with the
+        results that are not None.
+        """
+        if not self.in_process:
+            wrapped_fn = cloudpickle.dumps(func)
+
+        for item in iterable:
+            if self.in_process:
+                apply_func, args, size = func, (item,), 0
+            else:
+                payload = cloudpickle.dumps(item)
+                apply_func, args, size = (
+                    cloud_unpack_all_and_call,
+                    ((wrapped_fn, payload),),
+                    len(payload),
+                )
+
+            self._acquire(size)
+
+            def on_success(result, item_=item, size_=size):
+                try:
+                    if on_result and result is not None:
+                        on_result(result)
+                except Exception:
+                    # Don't break the thread that handles the results of the pool
+                    logger.exception(f"Failed to handle the result of {item_}")
+                finally:
+                    self._release(size_)
+
+            def on_error(exc, item_=item, size_=size):
+                logger.error(f"Failed to run {item_}", exc_info=exc)
+                self._release(size_)
+
+            try:
+                self.pool.apply_async(
+                    apply_func, args, callback=on_success, error_callback=on_error
+                )
+            except Exception:
+                self._release(size)
+                raise
 
     def join(self):
         self.pool.close()
         self.pool.join()
+
+
+class AsyncTaskExecutor:
+    """
+    Run all tasks from a single event loop in this process. `func` must return an
+    awaitable; at most `concurrency` of them are awaited at the same time.
+
+    Blocking work (like `retrieve_http`) is expected to be offloaded to the default
+    executor of the loop, which is sized to the concurrency.
+    """
+
+    is_async = True
+
+    def __init__(self, concurrency=0):
+        if not concurrency:
+            concurrency = int(os.environ.get("INGESTIFY_CONCURRENCY", "0")) or 64
+
+        self.concurrency = concurrency
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+
+    async def _run_all(self, func, iterable, on_result: Optional[Callable]):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_one(item):
+            async with semaphore:
+                try:
+                    result = await func(item)
+                    if on_result and result is not None:
+                        on_result(result)
+                except Exception:
+                    logger.exception(f"Failed to run {item}")
+
+        await asyncio.gather(*[run_one(item) for item in iterable])
+
+    def run(self, func, iterable, on_result: Optional[Callable] = None):
+        self.loop.run_until_complete(self._run_all(func, iterable, on_result))
+
+    def join(self):
+        self.loop.run_until_complete(self.loop.shutdown_default_executor())
+        self.loop.close()
+
+
+def uses_worker_processes(executor: Optional[str] = None) -> bool:
+    """Whether the TaskExecutor for `executor` runs the tasks in other processes."""
+    if not executor:
+        executor = os.environ.get("INGESTIFY_EXECUTOR", "processes")
+    return executor == "processes" and os.environ.get("INGESTIFY_RUN_EAGER") != "true"
+
+
+def get_task_executor(
+    executor: Optional[str] = None, processes=0, initializer=None, initargs=()
+):
+    """
+    Build the TaskExecutor to run tasks with. When `executor` is not passed, the
+    `INGESTIFY_EXECUTOR` environment variable is used.
+
+    `initializer` is called with `initargs` once in every worker process.
+    """
+    if not executor:
+        executor = os.environ.get("INGESTIFY_EXECUTOR", "processes")
+
+    if executor == "processes":
+        return TaskExecutor(processes, initializer=initializer, initargs=initargs)
+    elif executor == "threads":
+        return TaskExecutor(processes, threads=True)
+    elif executor == "async":
+        return AsyncTaskExecutor(processes)
+    else:
+        raise ConfigurationError(f"Unknown executor '{executor}'")
+
+
+def map_ordered(func, iterable, max_workers: int):
+    """
+    Like `map`, but calls `func` from up to `max_workers` threads at the same time. The
+    results are yielded in the order of `iterable`, and at most `max_workers` results
+    are kept in memory while waiting for the next one.
+    """
+    if max_workers <= 1:
+        yield from map(func, iterable)
+        return
+
+    iterator = iter(iterable)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = deque(
+            executor.submit(func, item) for item in islice(iterator, max_workers)
+        )
+        try:
+            while futures:
+                result = futures.popleft().result()
+                for item in islice(iterator, 1):
+                    futures.append(executor.submit(func, item))
+                yield result
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def map_unordered(func, iterable, max_workers: int):
+    """
+    Like `map_ordered`, but the results are yielded as soon as they are available.
+    """
+    if max_workers <= 1:
+        yield from map(func, iterable)
+        return
+
+    iterator = iter(iterable)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(func, item) for item in islice(iterator, max_workers)
+        }
+        try:
+            while futures:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for item in islice(iterator, 1):
+                        futures.add(executor.submit(func, item))
+                    yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
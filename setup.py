@@ -40,7 +40,11 @@ def setup_package():
             "boto3",
             "pytz",
         ],
-        extras_require={"test": ["pytest>=6.2.5,<7"]},
+        extras_require={
+            "test": ["pytest>=6.2.5,<7", "moto[s3]"],
+            "zstd": ["zstandard"],
+            "lz4": ["lz4"],
+        },
     )
 
 